@@ -3,7 +3,7 @@
 
 {
     "name": "Account Factoring Receivable Balance",
-    "version": "16.0.2.1.0",
+    "version": "16.0.2.7.0",
     "category": "Accounting",
     "license": "AGPL-3",
     "author": "Akretion",
@@ -19,10 +19,15 @@
         "security/ir.model.access.csv",
         "security/misc.xml",
         "views/account_journal.xml",
+        "wizards/subrogation_return_import.xml",
+        "wizards/subrogation_selection_preview.xml",
         "views/subrogation_receipt.xml",
+        "views/subrogation_receipt_summary.xml",
         "views/partner.xml",
         "views/account_move.xml",
         "data/action.xml",
+        "data/cron.xml",
+        "data/index.xml",
     ],
     "demo": [],
 }
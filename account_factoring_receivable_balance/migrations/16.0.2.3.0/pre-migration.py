@@ -0,0 +1,67 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    """Create and fill the new stored columns of account.move.line in SQL:
+    letting the ORM compute them at upgrade takes ages on a big ledger"""
+    if not version:
+        return
+    cr.execute(
+        """
+        ALTER TABLE account_move_line
+            ADD COLUMN IF NOT EXISTS factor_journal_id INTEGER,
+            ADD COLUMN IF NOT EXISTS bank_id INTEGER
+        """
+    )
+    cr.execute(
+        """
+        UPDATE account_move_line aml
+        SET bank_id = rpb.bank_id
+        FROM account_move am
+        JOIN res_partner_bank rpb ON rpb.id = am.partner_bank_id
+        WHERE am.id = aml.move_id AND rpb.bank_id IS NOT NULL
+        """
+    )
+    logger.info("bank_id set on %s account move lines", cr.rowcount)
+    # factor_journal_id is a company dependent field of the commercial partner:
+    # the value of the partner if any, otherwise the default value,
+    # the ones of the company before the ones shared by all companies
+    cr.execute(
+        """
+        WITH routing AS (
+            SELECT pc.partner_id, pc.company_id, prop.journal_id
+            FROM (
+                SELECT DISTINCT partner_id, company_id
+                FROM account_move_line
+                WHERE partner_id IS NOT NULL
+            ) pc
+            JOIN res_partner rp ON rp.id = pc.partner_id
+            CROSS JOIN LATERAL (
+                SELECT NULLIF(SPLIT_PART(ip.value_reference, ',', 2), '')::INTEGER
+                    AS journal_id
+                FROM ir_property ip
+                JOIN ir_model_fields imf ON imf.id = ip.fields_id
+                WHERE imf.model = 'res.partner'
+                    AND imf.name = 'factor_journal_id'
+                    AND (
+                        ip.res_id = 'res.partner,' || rp.commercial_partner_id
+                        OR ip.res_id IS NULL
+                    )
+                    AND (ip.company_id = pc.company_id OR ip.company_id IS NULL)
+                ORDER BY ip.res_id IS NULL, ip.company_id IS NULL
+                LIMIT 1
+            ) prop
+        )
+        UPDATE account_move_line aml
+        SET factor_journal_id = routing.journal_id
+        FROM routing
+        WHERE aml.partner_id = routing.partner_id
+            AND aml.company_id = routing.company_id
+            AND routing.journal_id IS NOT NULL
+        """
+    )
+    logger.info("factor_journal_id set on %s account move lines", cr.rowcount)
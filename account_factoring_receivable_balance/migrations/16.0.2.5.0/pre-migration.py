@@ -0,0 +1,17 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+RELATION = "account_move_line_subrogation_receipt_rel"
+
+
+def migrate(cr, version):
+    """item_ids duplicated line_ids: the ORM doesn't drop the relation
+    table of a removed many2many field"""
+    if not version:
+        return
+    cr.execute(f"DROP TABLE IF EXISTS {RELATION}")  # pylint: disable=sql-injection
+    cr.execute("DELETE FROM ir_model_relation WHERE name = %s", (RELATION,))
+    logger.info("Table %s dropped", RELATION)
@@ -0,0 +1,69 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import logging
+
+from odoo.tools.sql import column_exists
+
+logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    """A single draft per journal and company is allowed by the
+    draft_per_journal_excl constraint: the most recent draft is kept,
+    the lines of the others are released and they are deleted"""
+    if not version:
+        return
+    cr.execute(
+        """
+        SELECT id, factor_journal_id, company_id FROM (
+            SELECT id, factor_journal_id, company_id,
+                ROW_NUMBER() OVER (
+                    PARTITION BY factor_journal_id, company_id ORDER BY id DESC
+                ) AS rank
+            FROM subrogation_receipt
+            WHERE state = 'draft'
+        ) drafts
+        WHERE rank > 1
+        """
+    )
+    duplicates = cr.fetchall()
+    if not duplicates:
+        return
+    ids = [row[0] for row in duplicates]
+    cr.execute(
+        "UPDATE account_move_line SET subrogation_id = NULL "
+        "WHERE subrogation_id = ANY(%s)",
+        (ids,),
+    )
+    released = cr.rowcount
+    for table, model_column in (
+        ("mail_message", "model"),
+        ("mail_followers", "res_model"),
+        ("mail_activity", "res_model"),
+    ):
+        # pylint: disable=sql-injection
+        cr.execute(
+            f"DELETE FROM {table} WHERE {model_column} = 'subrogation.receipt' "
+            "AND res_id = ANY(%s)",
+            (ids,),
+        )
+    cr.execute("DELETE FROM subrogation_receipt WHERE id = ANY(%s)", (ids,))
+    if column_exists(cr, "subrogation_receipt", "last_compute_date"):
+        # the released lines are claimed by the next computation
+        cr.execute(
+            """
+            UPDATE subrogation_receipt SET last_compute_date = NULL
+            WHERE state = 'draft'
+                AND (factor_journal_id, company_id) IN %s
+            """,
+            (tuple({row[1:] for row in duplicates}),),
+        )
+    for receipt_id, journal_id, company_id in duplicates:
+        logger.warning(
+            "Draft subrogation receipt %s deleted: another draft exists "
+            "for journal %s in company %s",
+            receipt_id,
+            journal_id,
+            company_id,
+        )
+    logger.info("%s lines of the deleted drafts released", released)
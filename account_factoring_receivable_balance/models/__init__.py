@@ -1,6 +1,12 @@
 from . import company
+from . import account_account
 from . import account_journal
 from . import account_move_line
 from . import account_move
 from . import res_partner
 from . import subrogation_receipt
+from . import subrogation_receipt_job
+from . import subrogation_receipt_perf
+from . import ir_attachment
+from . import ir_property
+from . import ir_cron
@@ -0,0 +1,17 @@
+# © 2024 David BEAL @ Akretion
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+from odoo import models
+
+
+class AccountAccount(models.Model):
+    _inherit = "account.account"
+
+    def write(self, vals):
+        res = super().write(vals)
+        if "account_type" in vals:
+            # lines of the account change of eligibility without being written
+            self.env["subrogation.receipt"]._reset_compute_watermark(
+                companies=self.company_id
+            )
+        return res
@@ -50,6 +50,20 @@ class AccountJournal(models.Model):
         string="Expense Account",
         tracking=True,
     )
+    factoring_expense_tax_account_id = fields.Many2one(
+        comodel_name="account.account",
+        string="Expense Tax Account",
+        tracking=True,
+        help="Deductible VAT on the factor fees",
+    )
+    factor_post_grouping = fields.Selection(
+        [("partner", "Per Partner"), ("move", "Per Move")],
+        string="Transfer Grouping",
+        default="partner",
+        required=True,
+        help="Receivables are transfered to the factor with a line per "
+        "partner or a line per move",
+    )
 
     _sql_constraints = [
         (
@@ -1,7 +1,9 @@
 # © 2023 David BEAL @ Akretion
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 
-from odoo import fields, models
+from collections import defaultdict
+
+from odoo import api, fields, models
 
 
 class AccountMove(models.Model):
@@ -12,6 +14,8 @@ class AccountMove(models.Model):
     )
     use_factor = fields.Boolean(
         compute="_compute_use_factor",
+        store=True,
+        index=True,
         help="Depending on partner factor settings and skip factor field",
     )
     factor_journal_id = fields.Many2one(
@@ -20,15 +24,33 @@ class AccountMove(models.Model):
         store=False,
     )
 
+    @api.depends(
+        "skip_factor",
+        "date",
+        "journal_id",
+        "company_id",
+        "commercial_partner_id.factor_journal_id",
+        "commercial_partner_id.factor_journal_id.factor_start_date",
+        "commercial_partner_id.factor_journal_id.factor_invoice_journal_ids",
+    )
     def _compute_use_factor(self):
+        "Evaluate the factor domain once per factor journal, not once per move"
+        moves_per_journal = defaultdict(lambda: self.browse())
         for rec in self:
-            use_factor = False
-            rec = rec.with_company(rec.company_id.id)
-            factor_journal = rec.commercial_partner_id.factor_journal_id
+            rec.use_factor = False
+            if rec.skip_factor:
+                continue
+            factor_journal = rec.with_company(
+                rec.company_id.id
+            ).commercial_partner_id.factor_journal_id
             if factor_journal:
-                # TODO replace by adhoc odoo method : domain to python expression
-                domain = factor_journal._get_domain_for_factor()
-                domain.extend([("id", "=", rec.id), ("skip_factor", "=", False)])
-                if rec.search(domain):
-                    use_factor = True
-            rec.use_factor = use_factor
+                moves_per_journal[factor_journal] |= rec
+        for factor_journal, moves in moves_per_journal.items():
+            domain = factor_journal._get_domain_for_factor()
+            # new records (onchange) are evaluated against their origin
+            domain.append(("id", "in", moves._origin.ids))
+            factor_moves = self.with_company(factor_journal.company_id.id).search(
+                domain
+            )
+            for move in moves:
+                move.use_factor = move._origin in factor_moves
@@ -2,7 +2,54 @@
 # © 2022 Alexis DE LATTRE @ Akretion
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 
-from odoo import fields, models
+import logging
+from contextlib import closing
+
+from odoo import api, fields, models, sql_db
+
+_logger = logging.getLogger(__name__)
+
+# Indexes of the factor selection and of the receipt lines, the planner
+# can't use the generic ones on a large account_move_line table
+FACTOR_INDEXES = {
+    "account_move_line_factor_selection_idx": """
+        ON account_move_line (factor_journal_id, date)
+        WHERE parent_state = 'posted'
+            AND full_reconcile_id IS NULL
+            AND subrogation_id IS NULL
+    """,
+    "account_move_line_subrogation_id_idx": """
+        ON account_move_line (subrogation_id)
+        WHERE subrogation_id IS NOT NULL
+    """,
+}
+
+
+def create_indexes_concurrently(dbname, indexes):
+    """Create the indexes without locking writes on the table: this is only
+    possible outside of a transaction, in autocommit mode.
+    Return False if another creation is running"""
+    with closing(sql_db.db_connect(dbname).cursor()) as cr:
+        cr._cnx.autocommit = True
+        try:
+            cr.execute("SELECT pg_try_advisory_lock(hashtext('factor_indexes'))")
+            if not cr.fetchone()[0]:
+                return False
+            for name, invalid in indexes.items():
+                # pylint: disable=sql-injection
+                if invalid:
+                    # left by an interrupted creation
+                    cr.execute(f'DROP INDEX CONCURRENTLY IF EXISTS "{name}"')
+                cr.execute(
+                    f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{name}" '
+                    f"{FACTOR_INDEXES[name]}"
+                )
+                _logger.info("Index %s created", name)
+            return True
+        finally:
+            # the connection goes back to the pool without the session lock
+            cr.execute("SELECT pg_advisory_unlock_all()")
+            cr._cnx.autocommit = False
 
 
 class AccountMoveLine(models.Model):
@@ -16,6 +63,69 @@ class AccountMoveLine(models.Model):
     bank_id = fields.Many2one(
         comodel_name="res.bank",
         related="move_id.partner_bank_id.bank_id",
+        store=True,
+        index=True,
         string="Recipient Bank",
         help="Bank of the partner",
     )
+    factor_origin_line_id = fields.Many2one(
+        comodel_name="account.move.line",
+        string="Factor Origin Line",
+        index="btree_not_null",
+        readonly=True,
+        copy=False,
+        help="Receipt line this line was booked for by the factor entries",
+    )
+    factor_journal_id = fields.Many2one(
+        comodel_name="account.journal",
+        compute="_compute_factor_journal_id",
+        store=True,
+        index=True,
+        string="Factor Journal",
+        help="Factor journal of the commercial partner in the company of the line",
+    )
+
+    @api.depends("partner_id.commercial_partner_id.factor_journal_id", "company_id")
+    def _compute_factor_journal_id(self):
+        # factor_journal_id is company dependent: read it once per company
+        for company in self.company_id:
+            lines = self.filtered(lambda s, c=company: s.company_id == c)
+            for line in lines.with_company(company.id):
+                line.factor_journal_id = (
+                    line.partner_id.commercial_partner_id.factor_journal_id
+                )
+        self.filtered(lambda s: not s.company_id).factor_journal_id = False
+
+    @api.model
+    def _get_missing_factor_indexes(self):
+        "{name: invalid} of the factor indexes to (re)create"
+        self.env.cr.execute(
+            """
+            SELECT c.relname, i.indisvalid
+            FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE c.relname IN %s
+            """,
+            (tuple(FACTOR_INDEXES),),
+        )
+        valid = dict(self.env.cr.fetchall())
+        return {
+            name: name in valid for name in FACTOR_INDEXES if not valid.get(name)
+        }
+
+    @api.model
+    def _trigger_factor_indexes(self):
+        "Called at install and upgrade"
+        self.env.ref(
+            "account_factoring_receivable_balance.cron_factor_indexes"
+        )._trigger()
+
+    @api.model
+    def _cron_create_factor_indexes(self):
+        """A concurrent creation waits for all the transactions older than
+        itself: the job transaction is committed first and not used during
+        the creation, the transaction of the cron lock too (see ir.cron).
+        An interrupted creation is resumed by the next call"""
+        indexes = self._get_missing_factor_indexes()
+        if indexes:
+            self.env.cr.commit()  # pylint: disable=invalid-commit
+            create_indexes_concurrently(self.env.cr.dbname, indexes)
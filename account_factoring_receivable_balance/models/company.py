@@ -2,9 +2,17 @@
 # © 2022 Alexis DE LATTRE @ Akretion
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 
+import logging
+import random
+from datetime import timedelta
+
 from odoo import Command, _, api, fields, models
 from odoo.exceptions import UserError
-from odoo.tests.common import Form
+from odoo.tools import split_every
+
+from .subrogation_receipt import JOURNAL_DOMAIN
+
+logger = logging.getLogger(__name__)
 
 
 class ResCompany(models.Model):
@@ -37,20 +45,168 @@ class ResCompany(models.Model):
         self.env.ref("base.user_admin").company_ids = [Command.link(company.id)]
         return company
 
-    def _prepare_data_for_factor(self, move_type="out_invoice"):
+    def _get_factor_data_journal(self):
+        "Factor journal receiving the generated data"
         self.ensure_one()
-        move_form = Form(
-            self.env["account.move"]
-            .with_company(self.env.company)
-            .with_context(
-                default_move_type=move_type,
-                account_predictive_bills_disable_prediction=True,
+        return self.env["account.journal"].search(
+            JOURNAL_DOMAIN + [("company_id", "=", self.id)], limit=1
+        )
+
+    def _prepare_factor_partner_vals(self, journal, index):
+        return {
+            "name": f"Factor customer {index}",
+            "is_company": True,
+            "ref": f"FC{index:06d}",
+            "country_id": self.country_id.id,
+            "factor_journal_id": journal.id,
+        }
+
+    def _configure_factor_partners(self, journal, partners):
+        "Hook to complete the generated partners, i.e. factor identifiers"
+
+    def _factor_data_with_entries(self, journal):
+        "Whether the factor of the journal accepts miscellaneous entries"
+        return True
+
+    def _prepare_factor_move_vals(self, index, partner, move_date, accounts):
+        """Invoice, credit note or miscellaneous entry on the receivable
+        account, depending on index"""
+        amount = round(random.Random(index).uniform(10, 10000), 2)
+        name = f"Factor data {index}"
+        kind = index % 10
+        if kind == 9 and accounts["misc_journal"]:
+            return {
+                "move_type": "entry",
+                "journal_id": accounts["misc_journal"].id,
+                "date": move_date,
+                "ref": f"FD{index:08d}",
+                "line_ids": [
+                    Command.create(
+                        {
+                            "name": name,
+                            "partner_id": partner.id,
+                            "account_id": accounts["receivable"].id,
+                            "debit": amount,
+                        }
+                    ),
+                    Command.create(
+                        {
+                            "name": name,
+                            "partner_id": partner.id,
+                            "account_id": accounts["income"].id,
+                            "credit": amount,
+                        }
+                    ),
+                ],
+            }
+        return {
+            "move_type": "out_refund" if kind in (7, 8) else "out_invoice",
+            "partner_id": partner.id,
+            "journal_id": accounts["sale_journal"].id,
+            "currency_id": accounts["currency"].id,
+            "invoice_date": move_date,
+            "date": move_date,
+            "invoice_origin": f"SO{index:06d}",
+            "ref": f"FD{index:08d}",
+            "invoice_line_ids": [
+                Command.create(
+                    {
+                        "name": name,
+                        "quantity": 1,
+                        "price_unit": amount,
+                        "account_id": accounts["income"].id,
+                        "tax_ids": [Command.clear()],
+                    }
+                )
+            ],
+        }
+
+    def _prepare_data_for_factor(
+        self, journal, partner_count=10, move_count=100, date=None, batch_size=500
+    ):
+        """Bulk create partners using the factor journal and posted
+        invoices, credit notes and miscellaneous entries spread over
+        the previous 90 days. Return (partners, moves)"""
+        self.ensure_one()
+        self = self.with_company(self.id)
+        date = date or fields.Date.context_today(self)
+        journals = self.env["account.journal"]
+        sale_journal = journals.search(
+            [("type", "=", "sale"), ("company_id", "=", self.id)], limit=1
+        )
+        misc_journal = journals
+        if self._factor_data_with_entries(journal):
+            misc_journal = journals.search(
+                [
+                    ("type", "=", "general"),
+                    ("factor_type", "=", False),
+                    ("company_id", "=", self.id),
+                ],
+                limit=1,
             )
+            if not misc_journal:
+                raise UserError(_("A miscellaneous journal is required"))
+        if not sale_journal:
+            raise UserError(_("A sale journal is required"))
+        journal.factor_invoice_journal_ids |= sale_journal | misc_journal
+        # numbers follow the data generated before: refs and identifiers
+        # stay unique when data is generated several times in a database
+        partner_offset = (
+            self.env["res.partner"]
+            .sudo()
+            .with_context(active_test=False)
+            .search_count([("ref", "=like", "FC%")])
         )
-        move_form.invoice_date = fields.Date.from_string("2022-10-03")
-        move_form.date = move_form.invoice_date
-        move_form.partner_id = self.env.ref("base.res_partner_2")
+        move_offset = (
+            self.env["account.move"].sudo().search_count([("ref", "=like", "FD%")])
+        )
+        partners = self.env["res.partner"].create(
+            [
+                self._prepare_factor_partner_vals(journal, partner_offset + index)
+                for index in range(partner_count)
+            ]
+        )
+        self._configure_factor_partners(journal, partners)
+        accounts = {
+            "sale_journal": sale_journal,
+            "misc_journal": misc_journal,
+            "income": sale_journal.default_account_id,
+            "receivable": partners[:1].property_account_receivable_id,
+            "currency": journal.currency_id or self.currency_id,
+        }
+        move_ids = []
+        for indexes in split_every(batch_size, range(move_count)):
+            vals_list = [
+                self._prepare_factor_move_vals(
+                    move_offset + index,
+                    partners[index % partner_count],
+                    date - timedelta(days=index % 90),
+                    accounts,
+                )
+                for index in indexes
+            ]
+            moves = self.env["account.move"].create(vals_list)
+            moves.action_post()
+            move_ids += moves.ids
+            # keep the memory bounded on large volumes
+            self.env.flush_all()
+            self.env.invalidate_all()
+        logger.info("%s moves created for factor %s", len(move_ids), journal.name)
+        return partners, self.env["account.move"].browse(move_ids)
 
     def ui_populate_data_for_factor(self):
-        raise UserError(_("Not yet implemented"))
-        # self._prepare_data_for_factor()
+        self.ensure_one()
+        journal = self._get_factor_data_journal()
+        if not journal:
+            raise UserError(_("Configure a factor journal in this company first"))
+        __, moves = self._prepare_data_for_factor(journal)
+        return {
+            "type": "ir.actions.client",
+            "tag": "display_notification",
+            "params": {
+                "title": _("Factor data"),
+                "type": "success",
+                "message": _("%(count)s entries created for %(journal)s")
+                % {"count": len(moves), "journal": journal.display_name},
+            },
+        }
@@ -0,0 +1,64 @@
+# © 2024 David BEAL @ Akretion
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import hashlib
+import os
+import shutil
+
+from odoo import api, fields, models
+
+# size of the blocks copied from the temporary files to the filestore
+BLOCK_SIZE = 1 << 20
+
+
+class IrAttachment(models.Model):
+    _inherit = "ir.attachment"
+
+    factor_file_hash = fields.Char(
+        index=True,
+        readonly=True,
+        copy=False,
+        help="Hash of the inputs of the subrogation receipt factor file",
+    )
+
+    @api.model
+    def _create_factor_file(self, vals, stream):
+        """Create an attachment with the content of a binary file object,
+        copied by blocks to the filestore: the file is never entirely
+        in memory. Only the database storage needs the whole content"""
+        stream.seek(0)
+        if self._storage() == "db":
+            return self.create(dict(vals, raw=stream.read()))
+        sha = hashlib.sha1()
+        size = 0
+        for block in iter(lambda: stream.read(BLOCK_SIZE), b""):
+            sha.update(block)
+            size += len(block)
+        checksum = sha.hexdigest()
+        # same location as ir.attachment._get_path()
+        fname = f"{checksum[:2]}/{checksum}"
+        full_path = self._full_path(fname)
+        if not os.path.isfile(full_path):
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            stream.seek(0)
+            tmp_path = f"{full_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as target:
+                shutil.copyfileobj(stream, target, BLOCK_SIZE)
+            os.replace(tmp_path, full_path)
+        # the file is collected if the transaction is rolled back
+        self._mark_for_gc(fname)
+        attachment = self.create(dict(vals, raw=b""))
+        # the content related fields are computed by create() from the data
+        self.flush_model()
+        self.env.cr.execute(
+            """
+            UPDATE ir_attachment
+            SET store_fname = %s, checksum = %s, file_size = %s, db_datas = NULL
+            WHERE id = %s
+            """,
+            (fname, checksum, size, attachment.id),
+        )
+        attachment.invalidate_recordset(
+            ["store_fname", "checksum", "file_size", "db_datas", "raw", "datas"]
+        )
+        return attachment
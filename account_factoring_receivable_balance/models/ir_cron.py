@@ -0,0 +1,21 @@
+# © 2024 David BEAL @ Akretion
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+from odoo import SUPERUSER_ID, api, models
+
+INDEX_CRON = "account_factoring_receivable_balance.cron_factor_indexes"
+
+
+class IrCron(models.Model):
+    _inherit = "ir.cron"
+
+    @classmethod
+    def _process_job(cls, db, cron_cr, job):
+        env = api.Environment(cron_cr, SUPERUSER_ID, {})
+        cron = env.ref(INDEX_CRON, raise_if_not_found=False)
+        if cron and cron.id == job["id"]:
+            # the transaction holding the job lock has a snapshot older than
+            # the concurrent creation of the indexes, which would wait for it:
+            # it is committed first, an advisory lock prevents parallel runs
+            cron_cr.commit()  # pylint: disable=invalid-commit
+        return super()._process_job(db, cron_cr, job)
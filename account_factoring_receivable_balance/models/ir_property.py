@@ -0,0 +1,75 @@
+# © 2024 David BEAL @ Akretion
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+from odoo import api, models
+
+
+class IrProperty(models.Model):
+    _inherit = "ir.property"
+
+    def _get_factor_journal_properties(self):
+        field = self.env["ir.model.fields"]._get("res.partner", "factor_journal_id")
+        return self.filtered(lambda s: s.fields_id == field)
+
+    def _get_factor_journals(self):
+        "Journals given by the properties"
+        journal_ids = {
+            int(prop.value_reference.split(",")[1])
+            for prop in self
+            if prop.value_reference
+        }
+        return self.env["account.journal"].browse(journal_ids)
+
+    def _get_factor_journal_default_partners(self):
+        """Partners whose factor journal may be given by the default
+        properties (without res_id): any commercial partner"""
+        if all(self.mapped("res_id")):
+            return self.env["res.partner"]
+        self.env["res.partner"].flush_model(["commercial_partner_id"])
+        self.env.cr.execute(
+            "SELECT id FROM res_partner WHERE id = commercial_partner_id"
+        )
+        return self.env["res.partner"].browse(
+            [row[0] for row in self.env.cr.fetchall()]
+        )
+
+    def _factor_journal_modified(self, journals, partners):
+        """The stored factor routing of moves and lines depends on the
+        partners factor journal: the ORM recomputes it when the field is
+        written on partners, not when a default value changes.
+        The next computation of the drafts of the journals is a full one"""
+        if partners:
+            partners.modified(["factor_journal_id"])
+        self.env["subrogation.receipt"]._reset_compute_watermark(journals=journals)
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        props = records._get_factor_journal_properties()
+        if props:
+            self._factor_journal_modified(
+                props._get_factor_journals(),
+                props._get_factor_journal_default_partners(),
+            )
+        return records
+
+    def write(self, vals):
+        props = self._get_factor_journal_properties()
+        journals = props._get_factor_journals()
+        partners = props._get_factor_journal_default_partners()
+        res = super().write(vals)
+        props = self._get_factor_journal_properties()
+        journals |= props._get_factor_journals()
+        partners |= props._get_factor_journal_default_partners()
+        if journals or partners:
+            self._factor_journal_modified(journals, partners)
+        return res
+
+    def unlink(self):
+        props = self._get_factor_journal_properties()
+        journals = props._get_factor_journals()
+        partners = props._get_factor_journal_default_partners()
+        res = super().unlink()
+        if journals or partners:
+            self._factor_journal_modified(journals, partners)
+        return res
@@ -2,10 +2,61 @@
 # © 2022 Alexis DE LATTRE @ Akretion
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 
-from odoo import _, api, fields, models
+import hashlib
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing, contextmanager
+
+from odoo import Command, _, api, fields, models
 from odoo.exceptions import UserError
 
+_logger = logging.getLogger(__name__)
+
 JOURNAL_DOMAIN = [("factor_type", "!=", False), ("type", "=", "general")]
+# labels of the move types in the summary
+SUMMARY_MOVE_TYPES = {"out_invoice": "FAC", "out_refund": "AVO", "entry": "OD"}
+# partners detailed in the summary, the others are aggregated
+SUMMARY_PARTNERS = 20
+# lines displayed by the selection preview
+PREVIEW_SAMPLE = 20
+# rows read at once when processing the lines of a receipt
+CHUNK_SIZE = 5000
+# part of the factor file hash: bump it when the files generated
+# from the same inputs change
+FACTOR_FILE_VERSION = "1"
+# amounts booked by the factor entries, fixed once they are generated
+FACTOR_MOVES_FIELDS = {
+    "holdback_amount",
+    "expense_untaxed_amount",
+    "expense_tax_amount",
+}
+# default size of the worker pool of batch runs
+BATCH_WORKERS = 4
+
+
+def server_side_cursor(cr):
+    """Named psycopg2 cursor in the transaction of cr: rows are kept
+    in the database until fetched
+
+    The psycopg2 connection is used directly: queries of this cursor are
+    neither counted (sql_log_count, query_count of the tests) nor written
+    in the SQL log of odoo.sql_db, they only appear in the PostgreSQL logs."""
+    # test cursors wrap the actual one
+    cr = getattr(cr, "_cursor", cr)
+    return cr._cnx.cursor(name=f"subrogation_{uuid.uuid4().hex}")
+
+
+def plan_index_names(node):
+    "Names of the indexes used by a node of a JSON query plan"
+    if node.get("Index Name"):
+        yield node["Index Name"]
+    for child in node.get("Plans", []):
+        yield from plan_index_names(child)
 
 
 def journal_domain(self):
@@ -75,28 +126,72 @@ class SubrogationReceipt(models.Model):
         inverse_name="subrogation_id",
         readonly=True,
     )
-    item_ids = fields.Many2many(
-        comodel_name="account.move.line",
+    line_count = fields.Integer(compute="_compute_line_count")
+    move_ids = fields.Many2many(
+        comodel_name="account.move",
+        string="Accounting Entries",
         readonly=True,
+        copy=False,
+        help="Transfer, holdback and fee entries generated at posting",
+    )
+    summary = fields.Html(
+        readonly=True,
+        copy=False,
+        help="Totals of the lines, refreshed by the computation",
+    )
+    factor_file_hash = fields.Char(
+        readonly=True,
+        copy=False,
+        help="Hash of the inputs of the factor files generated at confirmation",
+    )
+    last_compute_date = fields.Datetime(
+        readonly=True,
+        copy=False,
+        help="Next computations only examine lines written after this date",
+    )
+    last_compute_key = fields.Char(
+        readonly=True,
+        copy=False,
+        help="Signature of the selection parameters of the last computation",
+    )
+    job_ids = fields.One2many(
+        comodel_name="subrogation.receipt.job",
+        inverse_name="receipt_id",
+        readonly=True,
+    )
+    perf_ids = fields.One2many(
+        comodel_name="subrogation.receipt.perf",
+        inverse_name="receipt_id",
+        string="Performance",
+        readonly=True,
+    )
+    perf_explain = fields.Boolean(
+        string="Capture Query Plan",
+        help="Store the plan (EXPLAIN ANALYZE) of the selection query "
+        "at the next computation",
     )
+    job_state = fields.Selection(
+        related="job_ids.state", string="Last Job State", readonly=True
+    )
+
+    _sql_constraints = [
+        (
+            "draft_per_journal_excl",
+            "EXCLUDE (factor_journal_id WITH =, company_id WITH =) "
+            "WHERE (state = 'draft')",
+            "You already have a Draft Subrogation with this journal and company.",
+        )
+    ]
 
-    @api.constrains("factor_journal_id", "state", "company_id")
-    def _check_draft_per_journal(self):
+    def _compute_line_count(self):
+        data = self.env["account.move.line"].read_group(
+            [("subrogation_id", "in", self.ids)], ["subrogation_id"], ["subrogation_id"]
+        )
+        counts = {
+            datum["subrogation_id"][0]: datum["subrogation_id_count"] for datum in data
+        }
         for rec in self:
-            count_drafts = self.search_count(
-                [
-                    ("factor_journal_id", "=", rec.factor_journal_id.id),
-                    ("state", "=", "draft"),
-                    ("company_id", "=", rec._get_company_id()),
-                ]
-            )
-            if count_drafts > 1:
-                raise UserError(
-                    _(
-                        "You already have a Draft Subrogation with "
-                        "this journal and company."
-                    )
-                )
+            rec.line_count = counts.get(rec.id, 0)
 
     @api.depends("factor_journal_id", "date")
     def _compute_display_name(self):
@@ -120,11 +215,7 @@ class SubrogationReceipt(models.Model):
             ("full_reconcile_id", "=", False),
             ("move_id.skip_factor", "=", False),
             ("subrogation_id", "=", False),
-            (
-                "partner_id.commercial_partner_id.factor_journal_id",
-                "=",
-                self.factor_journal_id.id,
-            ),
+            ("factor_journal_id", "=", self.factor_journal_id.id),
             # "|",
             # ("move_id.partner_bank_id", "=", bank_journal.bank_account_id.id),
             # ("move_id.partner_bank_id", "=", False),
@@ -152,21 +243,509 @@ class SubrogationReceipt(models.Model):
         domain = self._get_domain_for_factor()
         raise UserError(f"Here is conditions to select move lines\n\n{domain}")
 
+    def _get_selection_preview(self, sample_size=PREVIEW_SAMPLE):
+        """What the computation would select, without writing anything:
+        count, totals by currency and breakdowns by journal and move type
+        aggregated by a single query, and a sample of the most recent lines"""
+        self.ensure_one()
+        cr = self.env.cr
+        query, params = self._get_claim_query(
+            columns='"account_move_line".journal_id, "account_move_line".move_id, '
+            '"account_move_line".currency_id, "account_move_line".amount_currency'
+        )
+        # pylint: disable=sql-injection
+        cr.execute(
+            f"""
+            WITH lines AS ({query})
+            SELECT GROUPING(lines.journal_id, am.move_type, lines.currency_id),
+                lines.journal_id, am.move_type, lines.currency_id,
+                COUNT(*), COALESCE(SUM(lines.amount_currency), 0)
+            FROM lines JOIN account_move am ON am.id = lines.move_id
+            GROUP BY GROUPING SETS (
+                (lines.journal_id, lines.currency_id),
+                (am.move_type, lines.currency_id),
+                (lines.currency_id),
+                ()
+            )
+            ORDER BY 1, 4, 2, 3
+            """,
+            params,
+        )
+        journals = self.env["account.journal"]
+        currencies = self.env["res.currency"]
+        preview = {"count": 0, "totals": [], "by_journal": [], "by_type": []}
+        for grouping, journal_id, move_type, currency_id, count, total in cr.fetchall():
+            # amounts are only summed by currency
+            row = {
+                "currency": currencies.browse(currency_id),
+                "count": count,
+                "total": total,
+            }
+            # GROUPING() bits are set for the columns which are not grouped
+            if grouping == 0b010:
+                preview["by_journal"].append(dict(row, key=journals.browse(journal_id)))
+            elif grouping == 0b100:
+                row["key"] = SUMMARY_MOVE_TYPES.get(move_type, move_type)
+                preview["by_type"].append(row)
+            elif grouping == 0b110:
+                preview["totals"].append(row)
+            else:
+                preview["count"] = count
+        query, params = self._get_claim_query(
+            columns='"account_move_line".id, "account_move_line".date'
+        )
+        cr.execute(
+            f"""
+            SELECT lines.id FROM ({query}) lines
+            ORDER BY lines.date DESC, lines.id DESC
+            LIMIT %s
+            """,
+            params + [sample_size],
+        )
+        preview["sample"] = self.env["account.move.line"].browse(
+            [row[0] for row in cr.fetchall()]
+        )
+        return preview
+
+    def _explain_index_names(self, query, params):
+        # pylint: disable=sql-injection
+        self.env.cr.execute(f"EXPLAIN (FORMAT JSON) {query}", params)
+        plan = self.env.cr.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return set(plan_index_names(plan[0]["Plan"]))
+
+    def _check_factor_indexes(self):
+        """Report the factor indexes which are missing
+        or not used by the planner for the queries of the receipt"""
+        self.ensure_one()
+        messages = []
+        missing = self.env["account.move.line"]._get_missing_factor_indexes()
+        for name, invalid in missing.items():
+            messages.append(
+                _("Index %(name)s is %(state)s")
+                % {"name": name, "state": invalid and _("invalid") or _("missing")}
+            )
+        checks = (
+            ("account_move_line_factor_selection_idx", *self._get_claim_query()),
+            (
+                "account_move_line_subrogation_id_idx",
+                "SELECT id FROM account_move_line WHERE subrogation_id = %s",
+                [self.id],
+            ),
+        )
+        for name, query, query_params in checks:
+            if name in missing:
+                continue
+            used = self._explain_index_names(query, query_params)
+            if name not in used:
+                messages.append(
+                    _(
+                        "Index %(name)s is not used by the planner (used: %(used)s). "
+                        "Small tables are read sequentially, check the statistics "
+                        "of account_move_line otherwise."
+                    )
+                    % {"name": name, "used": ", ".join(sorted(used)) or "-"}
+                )
+        for message in messages:
+            _logger.warning(message)
+        return messages
+
+    def _raise_factor_indexes_check(self):
+        "called from server action"
+        messages = self._check_factor_indexes()
+        raise UserError("\n\n".join(messages) or _("Factor indexes are used"))
+
     def _get_factor_lines(self):
         domain = self._get_domain_for_factor()
         lines = self.env["account.move.line"].search(domain)
         return lines
 
+    def _get_claim_domains(self):
+        """Selection domains of the free lines and of the lines already
+        owned by the receipt"""
+        domain = self._get_domain_for_factor()
+        owned_domain = []
+        for leaf in domain:
+            if isinstance(leaf, list | tuple) and tuple(leaf) == (
+                "subrogation_id",
+                "=",
+                False,
+            ):
+                leaf = ("subrogation_id", "=", self.id)
+            owned_domain.append(leaf)
+        return domain, owned_domain
+
+    def _claim_factor_lines(self, since=None):
+        """Set-based selection of the receipt lines
+
+        Eligible lines are locked and claimed by a single UPDATE and lines
+        which are not eligible anymore are released. Return the ids of the
+        receipt lines.
+
+        With `since`, only the lines (or their moves) written after this
+        datetime are examined: any change of eligibility of a line
+        updates its write_date or the one of its move.
+        """
+        self.ensure_one()
+        cr = self.env.cr
+        aml_model = self.env["account.move.line"]
+        query, params = self._get_claim_query(
+            since,
+            columns='"account_move_line".id, "account_move_line".subrogation_id',
+        )
+        # Lines being claimed by a concurrent transaction are locked:
+        # they are skipped instead of waiting for it or claiming them twice
+        # pylint: disable=sql-injection
+        cr.execute(
+            f"""
+            WITH eligible AS ({query}), locked AS (
+                SELECT aml.id FROM account_move_line aml
+                WHERE aml.id IN (SELECT id FROM eligible)
+                    AND aml.subrogation_id IS NULL
+                FOR NO KEY UPDATE SKIP LOCKED
+            ), claimed AS (
+                UPDATE account_move_line aml
+                SET subrogation_id = %s,
+                    write_uid = %s,
+                    write_date = (now() at time zone 'UTC')
+                FROM locked
+                WHERE aml.id = locked.id
+                RETURNING aml.id
+            )
+            SELECT eligible.id,
+                claimed.id IS NOT NULL,
+                claimed.id IS NOT NULL OR eligible.subrogation_id = %s
+            FROM eligible LEFT JOIN claimed ON claimed.id = eligible.id
+            """,
+            params + [self.id, self.env.uid, self.id],
+        )
+        rows = cr.fetchall()
+        eligible_ids = [row[0] for row in rows]
+        changed_ids = [row[0] for row in rows if row[1]]
+        owned_ids = [row[0] for row in rows if row[2]]
+        if since:
+            # lines examined above are released if they didn't match
+            cr.execute(
+                """
+                UPDATE account_move_line aml
+                SET subrogation_id = NULL,
+                    write_uid = %s,
+                    write_date = (now() at time zone 'UTC')
+                FROM account_move am
+                WHERE am.id = aml.move_id
+                    AND aml.subrogation_id = %s
+                    AND (aml.write_date >= %s OR am.write_date >= %s)
+                    AND NOT (aml.id = ANY(%s))
+                RETURNING aml.id, aml.factor_journal_id
+                """,
+                (self.env.uid, self.id, since, since, eligible_ids),
+            )
+        else:
+            cr.execute(
+                """
+                UPDATE account_move_line
+                SET subrogation_id = NULL,
+                    write_uid = %s,
+                    write_date = (now() at time zone 'UTC')
+                WHERE subrogation_id = %s AND NOT (id = ANY(%s))
+                RETURNING id, factor_journal_id
+                """,
+                (self.env.uid, self.id, eligible_ids),
+            )
+        released = cr.fetchall()
+        changed_ids += [row[0] for row in released]
+        # released lines may be claimed by the drafts of their journal
+        journal_ids = {row[1] for row in released if row[1]}
+        self._reset_compute_watermark(
+            self.env["account.journal"].browse(list(journal_ids)), exclude=self
+        )
+        if since:
+            cr.execute(
+                "SELECT id FROM account_move_line WHERE subrogation_id = %s",
+                (self.id,),
+            )
+            line_ids = [row[0] for row in cr.fetchall()]
+        else:
+            line_ids = owned_ids
+        changed_lines = aml_model.browse(changed_ids)
+        changed_lines.invalidate_recordset(
+            ["subrogation_id", "write_uid", "write_date"]
+        )
+        self.invalidate_recordset(["line_ids", "line_count"])
+        changed_lines.modified(["subrogation_id"])
+        return line_ids
+
+    def _get_claim_query(self, since=None, columns='"account_move_line".id'):
+        """SQL (query, params) selecting the columns of the lines eligible
+        to the receipt: the free lines, then the lines of the receipt.
+        Separate parts let the planner use the partial selection index,
+        restricted to the free lines, for the first one"""
+        self.env.flush_all()
+        parts = []
+        params = []
+        for domain in self._get_claim_domains():
+            if since:
+                domain = domain + [
+                    "|",
+                    ("write_date", ">=", since),
+                    ("move_id.write_date", ">=", since),
+                ]
+            from_clause, where_clause, where_params = (
+                self.env["account.move.line"]._search(domain).get_sql()
+            )
+            parts.append(f"SELECT {columns} FROM {from_clause} WHERE {where_clause}")
+            params += where_params
+        return "\nUNION ALL\n".join(parts), params
+
+    def _explain_claim_query(self, since=None):
+        "Execution plan of the selection query"
+        query, params = self._get_claim_query(since)
+        # pylint: disable=sql-injection
+        self.env.cr.execute(f"EXPLAIN (ANALYZE, BUFFERS) {query}", params)
+        return "\n".join(row[0] for row in self.env.cr.fetchall())
+
+    @contextmanager
+    def _perf_phase(self, action, phase):
+        """Measure wall time and SQL queries of a phase, the phase
+        may set 'rows' and 'plan' in the yielded dict.
+        Measures are logged and stored on the receipt, failed phases too"""
+        self.ensure_one()
+        cr = self.env.cr
+        # query time is only measured in the threads of http requests
+        thread = threading.current_thread()
+        timed = hasattr(thread, "query_time")
+        # pending writes are not attributed to the phase
+        self.env.flush_all()
+        stat = {"rows": 0, "plan": False}
+        query_count = cr.sql_log_count
+        query_time = thread.query_time if timed else 0
+        start = time.perf_counter()
+        error = False
+        try:
+            yield stat
+            self.env.flush_all()
+        except Exception as e:
+            error = str(e) or repr(e)
+            raise
+        finally:
+            vals = {
+                "receipt_id": self.id,
+                "action": action,
+                "name": phase,
+                "duration": time.perf_counter() - start,
+                "query_count": cr.sql_log_count - query_count,
+                "query_time": thread.query_time - query_time if timed else 0,
+                "rows": stat["rows"],
+                "plan": stat["plan"],
+                "error": error,
+            }
+            _logger.info(
+                "Subrogation %s %s/%s: %.3fs, %s queries (%.3fs), %s rows%s",
+                self.id,
+                action,
+                phase,
+                vals["duration"],
+                vals["query_count"],
+                vals["query_time"],
+                vals["rows"],
+                error and ", failed" or "",
+            )
+            self.env["subrogation.receipt.perf"]._store(vals)
+
+    def _get_compute_key(self):
+        """Signature of the selection parameters: a delta computation
+        is only relevant while it doesn't change"""
+        domain = self._get_domain_for_factor()
+        return hashlib.sha1(repr(domain).encode()).hexdigest()
+
+    def _get_compute_since(self, compute_key):
+        "Lower bound of the lines to examine, None for a full computation"
+        if not self.last_compute_date or self.last_compute_key != compute_key:
+            return None
+        return self.last_compute_date
+
+    def _get_compute_watermark(self):
+        """Start of the oldest transaction in progress on the database.
+
+        write_date is the start of the transaction writing the record: the
+        changes which are not visible to this computation are written after
+        the watermark, whatever the duration of their transaction. Sessions
+        of other database users are not visible and not taken into account.
+        """
+        self.env.cr.execute(
+            """
+            SELECT MIN(xact_start) AT TIME ZONE 'UTC'
+            FROM pg_stat_activity
+            WHERE datname = current_database() AND xact_start IS NOT NULL
+            """
+        )
+        return self.env.cr.fetchone()[0] or self.env.cr.now()
+
+    @api.model
+    def _reset_compute_watermark(self, journals=None, companies=None, exclude=None):
+        """Next computation of the drafts of the journals (or companies)
+        is a full one: lines may have become eligible without being written,
+        i.e. freed by the deletion of their receipt"""
+        domain = [("state", "=", "draft"), ("last_compute_date", "!=", False)]
+        if journals is not None:
+            if not journals:
+                return
+            domain.append(("factor_journal_id", "in", journals.ids))
+        if companies is not None:
+            domain.append(("company_id", "in", companies.ids))
+        if exclude:
+            domain.append(("id", "not in", exclude.ids))
+        self.sudo().search(domain).write({"last_compute_date": False})
+
+    def _get_summary_data(self):
+        """Totals of the lines by move type, partner, currency and market,
+        aggregated by a single query"""
+        self.ensure_one()
+        self.env.flush_all()
+        self.env.cr.execute(
+            """
+            WITH lines AS (
+                SELECT am.move_type,
+                    crp.id AS partner_id,
+                    aml.currency_id,
+                    COALESCE(country.code, '') = 'FR' AS domestic,
+                    aml.amount_currency,
+                    aml.balance,
+                    COALESCE(aml.date_maturity, aml.date) AS date_due
+                FROM account_move_line aml
+                JOIN account_move am ON am.id = aml.move_id
+                LEFT JOIN res_partner rp ON rp.id = aml.partner_id
+                LEFT JOIN res_partner crp ON crp.id = rp.commercial_partner_id
+                LEFT JOIN res_country country ON country.id = crp.country_id
+                WHERE aml.subrogation_id = %s
+            )
+            SELECT GROUPING(move_type, partner_id, currency_id, domestic),
+                move_type, partner_id, currency_id, domestic,
+                COUNT(*), SUM(amount_currency), SUM(balance), MIN(date_due)
+            FROM lines
+            GROUP BY GROUPING SETS (
+                (move_type), (partner_id), (currency_id), (domestic), ()
+            )
+            """,
+            (self.id,),
+        )
+        data = {
+            "move_type": [],
+            "partner": [],
+            "currency": [],
+            "market": [],
+            "total": [],
+        }
+        for row in self.env.cr.fetchall():
+            grouping, move_type, partner_id, currency_id, domestic = row[:5]
+            # GROUPING() bits are set for the columns which are not grouped
+            if grouping == 0b0111:
+                key, value = "move_type", SUMMARY_MOVE_TYPES.get(move_type, move_type)
+            elif grouping == 0b1011:
+                key, value = "partner", partner_id
+            elif grouping == 0b1101:
+                key, value = "currency", currency_id
+            elif grouping == 0b1110:
+                key, value = "market", domestic and _("Domestic") or _("Export")
+            else:
+                key, value = "total", _("Total")
+            count, amount_currency, balance, date_due = row[5:]
+            data[key].append(
+                {
+                    "key": value,
+                    "count": count,
+                    "amount_currency": amount_currency,
+                    "balance": balance,
+                    "date_due": date_due,
+                }
+            )
+        data["currency"] = [
+            dict(datum, key=self.env["res.currency"].browse(datum["key"]))
+            for datum in data["currency"]
+        ]
+        partners = sorted(data["partner"], key=lambda s: -abs(s["balance"]))
+        data["partner"] = [
+            dict(datum, key=self.env["res.partner"].browse(datum["key"]))
+            for datum in partners[:SUMMARY_PARTNERS]
+        ]
+        data["other_partners"] = len(partners) - len(data["partner"])
+        return data
+
+    def _render_summary(self):
+        return self.env["ir.qweb"]._render(
+            "account_factoring_receivable_balance.subrogation_receipt_summary",
+            {
+                "data": self._get_summary_data(),
+                "company_currency": self.company_id.currency_id,
+            },
+        )
+
+    def _iter_chunks(self, query, params, size=None):
+        """Yield the rows of query by lists of `size` rows read from a server
+        side cursor, the environment cache is cleared between chunks:
+        the memory used doesn't depend on the number of rows"""
+        size = size or CHUNK_SIZE
+        self.env.flush_all()
+        with closing(server_side_cursor(self.env.cr)) as cr:
+            cr.execute(query, params)
+            while True:
+                rows = cr.fetchmany(size)
+                if not rows:
+                    break
+                yield rows
+                self.env.invalidate_all()
+
+    def _get_lines_balance(self):
+        "Sum of the lines amounts, computed in SQL"
+        self.ensure_one()
+        self.env["account.move.line"].flush_model(["amount_currency", "subrogation_id"])
+        self.env.cr.execute(
+            """
+            SELECT COALESCE(SUM(amount_currency), 0)
+            FROM account_move_line
+            WHERE subrogation_id = %s
+            """,
+            (self.id,),
+        )
+        return self.env.cr.fetchone()[0]
+
+    def _check_no_active_job(self):
+        "Synchronous actions are forbidden while a job is queued on the receipt"
+        if self.env.context.get("subrogation_job_id"):
+            return
+        if self.job_ids.filtered(lambda s: s.state in ("pending", "running")):
+            raise UserError(
+                _("A background job is queued on this receipt, wait for its end")
+            )
+
+    def _job_progress(self, **vals):
+        "Report progress (lines_selected, rows_written) to the running job"
+        job_id = self.env.context.get("subrogation_job_id")
+        if job_id:
+            self.env["subrogation.receipt.job"]._report_progress(job_id, vals)
+
     def action_compute_lines(self):
         self.ensure_one()
+        self._check_no_active_job()
         self.warn = False
-        self.line_ids.write({"subrogation_id": False})
-        lines = self._get_factor_lines()
-        lines.write({"subrogation_id": self.id})
-        if not lines:
+        compute_key = self._get_compute_key()
+        since = self._get_compute_since(compute_key)
+        watermark = self._get_compute_watermark()
+        with self._perf_phase("compute", "selection") as stat:
+            if self.perf_explain:
+                stat["plan"] = self._explain_claim_query(since)
+            line_ids = self._claim_factor_lines(since=since)
+            stat["rows"] = len(line_ids)
+        self._job_progress(lines_selected=len(line_ids))
+        vals = {
+            "last_compute_date": watermark,
+            "last_compute_key": compute_key,
+            "perf_explain": False,
+        }
+        if not line_ids:
             domain = self._get_domain_for_factor()
-            self.warn = f"Le domaine ne ramène aucune donnée \n{domain}"
-        vals = {"item_ids": [(6, 0, lines.ids)]}
+            vals["warn"] = f"Le domaine ne ramène aucune donnée \n{domain}"
         if not self.statement_date:
             statement = self.env["account.bank.statement"].search(
                 [
@@ -179,10 +758,161 @@ class SubrogationReceipt(models.Model):
             )
             if statement:
                 vals["statement_date"] = statement.date
-        if self.item_ids:
-            vals["balance"] = sum(self.item_ids.mapped("amount_currency"))
+        vals["summary"] = False
+        if line_ids:
+            with self._perf_phase("compute", "balance"):
+                vals["balance"] = self._get_lines_balance()
+            with self._perf_phase("compute", "summary"):
+                vals["summary"] = self._render_summary()
         return self.write(vals)
 
+    def action_compute_lines_full(self):
+        "Recompute the lines from scratch, ignoring the last computation"
+        self.write({"last_compute_date": False, "last_compute_key": False})
+        return self.action_compute_lines()
+
+    def action_compute_lines_async(self):
+        self.env["subrogation.receipt.job"]._enqueue(self, "compute")
+
+    def action_confirm_async(self):
+        self.env["subrogation.receipt.job"]._enqueue(
+            self.filtered(lambda s: s.state == "draft"), "confirm"
+        )
+
+    @api.model
+    def _get_batch_units(self):
+        "(company id, journal id) of every factor journal of the user companies"
+        journals = (
+            self.env["account.journal"]
+            .with_context(allowed_company_ids=self.env.user.company_ids.ids)
+            .search(JOURNAL_DOMAIN)
+        )
+        return [(journal.company_id.id, journal.id) for journal in journals]
+
+    @api.model
+    def _get_batch_receipt(self, journal_id):
+        "Draft receipt of the journal in the current company, created if needed"
+        receipt = self.search(
+            [
+                ("factor_journal_id", "=", journal_id),
+                ("state", "=", "draft"),
+                ("company_id", "=", self._get_company_id()),
+            ],
+            limit=1,
+        )
+        return receipt or self.create({"factor_journal_id": journal_id})
+
+    @api.model
+    def _run_batch_unit(self, company_id, journal_id, confirm=True):
+        """Compute (and confirm) the draft receipt of a journal
+        in its own transaction. Return the result of the unit"""
+        start = time.perf_counter()
+        result = {
+            "company_id": company_id,
+            "journal_id": journal_id,
+            "receipt_id": False,
+            "lines": 0,
+            "files": 0,
+            "state": False,
+            "error": False,
+        }
+        try:
+            with self.env.registry.cursor() as cr:
+                env = api.Environment(
+                    cr,
+                    self.env.uid,
+                    dict(self.env.context, allowed_company_ids=[company_id]),
+                )
+                receipt = env[self._name]._get_batch_receipt(journal_id)
+                result["receipt_id"] = receipt.id
+                receipt.action_compute_lines()
+                result["lines"] = len(receipt.line_ids)
+                # the computation is kept even if the files can't be generated
+                cr.commit()  # pylint: disable=invalid-commit
+                if confirm and receipt.line_ids:
+                    receipt.action_confirm()
+                    result["files"] = env["ir.attachment"].search_count(
+                        [("res_model", "=", self._name), ("res_id", "=", receipt.id)]
+                    )
+                result["state"] = receipt.state
+        except Exception as e:
+            _logger.exception("Batch run of journal %s failed", journal_id)
+            result["error"] = str(e)
+        result["duration"] = time.perf_counter() - start
+        return result
+
+    @api.model
+    def run_batch(self, confirm=True, max_workers=None):
+        """Compute and confirm the receipts of every factor journal
+        of every company, each journal on its own cursor in a bounded
+        pool of threads. Return the aggregated report"""
+        start = time.perf_counter()
+        units = self._get_batch_units()
+        if max_workers is None:
+            max_workers = int(
+                self.env["ir.config_parameter"]
+                .sudo()
+                .get_param(
+                    "account_factoring_receivable_balance.batch_workers", BATCH_WORKERS
+                )
+            )
+        # test cursors are shared by the whole registry: no threads in tests
+        if max_workers <= 1 or self.env.registry.in_test_mode():
+            results = [self._run_batch_unit(*unit, confirm=confirm) for unit in units]
+        else:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                results = list(
+                    executor.map(
+                        lambda unit: self._run_batch_unit(*unit, confirm=confirm),
+                        units,
+                    )
+                )
+        report = {
+            "units": results,
+            "lines": sum(result["lines"] for result in results),
+            "files": sum(result["files"] for result in results),
+            "failures": [result for result in results if result["error"]],
+            "duration": time.perf_counter() - start,
+        }
+        _logger.info(
+            "Subrogation batch: %s journals, %s lines, %s files, %s failures in %.1fs",
+            len(results),
+            report["lines"],
+            report["files"],
+            len(report["failures"]),
+            report["duration"],
+        )
+        return report
+
+    @api.model
+    def _cron_run_batch(self, confirm=True):
+        self.run_batch(confirm=confirm)
+
+    @api.model
+    def action_run_batch(self):
+        "Called from server action"
+        report = self.run_batch()
+        journals = self.env["account.journal"].sudo()
+        message = [
+            _("%(lines)s lines, %(files)s files in %(duration).1f seconds")
+            % report
+        ]
+        for failure in report["failures"]:
+            journal = journals.browse(failure["journal_id"])
+            message.append(
+                f"{journal.company_id.name} / {journal.name}: {failure['error']}"
+            )
+        return {
+            "type": "ir.actions.client",
+            "tag": "display_notification",
+            "params": {
+                "title": _("Subrogation batch run"),
+                "message": "\n".join(message),
+                "type": "danger" if report["failures"] else "success",
+                "sticky": bool(report["failures"]),
+            },
+        }
+
     def _get_bank_journal(self, factor_type, currency=None):
         """Get matching bank journal
         You may override to have a dedicated mapping"""
@@ -212,11 +942,87 @@ class SubrogationReceipt(models.Model):
             string = string.replace(elm, "_")
         return string
 
+    def _get_factor_file_hash_inputs(self):
+        """Values the factor files depend on, besides the lines.
+        Factor modules add their settings and format version"""
+        self.ensure_one()
+        return [
+            FACTOR_FILE_VERSION,
+            self.factor_type,
+            self.factor_journal_id.id,
+            self.factor_journal_id.factor_code,
+            self.company_id.id,
+            self.statement_date,
+        ]
+
+    def _get_factor_file_hash(self):
+        """Hash of the inputs of the factor files: the ordered lines
+        with their write dates and those of their moves and partners"""
+        self.ensure_one()
+        digest = hashlib.sha256(
+            json.dumps(self._get_factor_file_hash_inputs(), default=str).encode()
+        )
+        for rows in self._iter_chunks(
+            """
+            SELECT aml.id, aml.write_date, am.write_date,
+                commercial.write_date, shipping.write_date
+            FROM account_move_line aml
+            JOIN account_move am ON am.id = aml.move_id
+            LEFT JOIN res_partner commercial
+                ON commercial.id = am.commercial_partner_id
+            LEFT JOIN res_partner shipping ON shipping.id = am.partner_shipping_id
+            WHERE aml.subrogation_id = %s
+            ORDER BY aml.date DESC, aml.move_name DESC, aml.id
+            """,
+            (self.id,),
+        ):
+            for row in rows:
+                digest.update(("%s|%s|%s|%s|%s\n" % row).encode())
+        return digest.hexdigest()
+
+    def _get_factor_files(self):
+        "Attachments generated by the confirmation"
+        self.ensure_one()
+        return self.env["ir.attachment"].search(
+            [
+                ("res_model", "=", self._name),
+                ("res_id", "=", self.id),
+                ("factor_file_hash", "!=", False),
+            ]
+        )
+
+    def _create_factor_attachments(self, attach_list):
+        "Create the attachments of the factor files"
+        attachment_obj = self.env["ir.attachment"]
+        for vals in attach_list:
+            if vals.get("stream"):
+                vals = dict(vals)
+                attachment_obj._create_factor_file(vals, vals.pop("stream"))
+            else:
+                attachment_obj.create(vals)
+
     def action_confirm(self):
+        self._check_no_active_job()
         for rec in self:
             if rec.state == "draft":
                 rec.warn = False
-                data = self._prepare_factor_file(rec.factor_type)
+                file_hash = rec._get_factor_file_hash()
+                files = rec._get_factor_files()
+                if files and set(files.mapped("factor_file_hash")) == {file_hash}:
+                    # nothing changed since the files were generated:
+                    # the receipt keeps the date written in the files
+                    rec.write(
+                        {
+                            "date": fields.Date.context_today(
+                                rec, min(files.mapped("create_date"))
+                            ),
+                            "state": "confirmed",
+                            "factor_file_hash": file_hash,
+                        }
+                    )
+                    continue
+                with rec._perf_phase("confirm", "file"):
+                    data = self._prepare_factor_file(rec.factor_type)
                 # We support multi/single attachment(s)
                 if isinstance(data, dict):
                     data_ = [data]
@@ -224,12 +1030,25 @@ class SubrogationReceipt(models.Model):
                     data_ = data
                 attach_list = []
                 for datum in data_:
-                    if datum.get("datas"):
-                        attach_list.append(datum)
-                self.env["ir.attachment"].create(attach_list)
+                    # binary content may be given encoded (datas), not (raw)
+                    # or as a file object (stream) copied to the filestore
+                    if datum.get("datas") or datum.get("raw") or datum.get("stream"):
+                        attach_list.append(dict(datum, factor_file_hash=file_hash))
+                with rec._perf_phase("confirm", "attachments") as stat:
+                    try:
+                        if attach_list:
+                            # the files of previous inputs are replaced
+                            files.unlink()
+                        rec._create_factor_attachments(attach_list)
+                    finally:
+                        for vals in attach_list:
+                            if vals.get("stream"):
+                                vals["stream"].close()
+                    stat["rows"] = len(attach_list)
                 rec.date = fields.Date.today()
                 if data:
                     rec.state = "confirmed"
+                    rec.factor_file_hash = file_hash
 
     def action_post(self):
         for rec in self:
@@ -239,6 +1058,7 @@ class SubrogationReceipt(models.Model):
                 and rec.expense_untaxed_amount > 0
                 and rec.expense_tax_amount > 0
             ):
+                rec._post_factor_moves()
                 rec.state = "posted"
             else:
                 raise UserError(
@@ -248,21 +1068,234 @@ class SubrogationReceipt(models.Model):
                     )
                 )
 
+    def _get_transfer_groups(self):
+        """Open lines of the receipt aggregated in SQL by account, partner,
+        currency and, if configured on the journal, move.
+        Return tuples (key, name, residual, residual_currency, line_ids)"""
+        self.ensure_one()
+        self.env.flush_all()
+        by_move = self.factor_journal_id.factor_post_grouping == "move"
+        move_column = "aml.move_id" if by_move else "NULL::INTEGER"
+        # pylint: disable=sql-injection
+        self.env.cr.execute(
+            f"""
+            SELECT aml.account_id, aml.partner_id, aml.currency_id, {move_column},
+                MIN(aml.move_name),
+                SUM(aml.amount_residual),
+                SUM(aml.amount_residual_currency),
+                ARRAY_AGG(aml.id)
+            FROM account_move_line aml
+            WHERE aml.subrogation_id = %s AND NOT aml.reconciled
+            GROUP BY 1, 2, 3, 4
+            ORDER BY 1, 2, 3, 4
+            """,
+            (self.id,),
+        )
+        return [
+            (row[:3], row[4] if by_move else self.display_name, *row[5:])
+            for row in self.env.cr.fetchall()
+        ]
+
+    def _prepare_factor_moves_vals(self, groups):
+        """Vals of the transfer, holdback and fee moves,
+        lines are precomputed: no onchange is involved"""
+        self.ensure_one()
+        journal = self.factor_journal_id
+        accounts = {
+            "factoring_receivable_account_id": journal.factoring_receivable_account_id,
+            "factoring_current_account_id": journal.factoring_current_account_id,
+            "factoring_holdback_account_id": journal.factoring_holdback_account_id,
+            "factoring_expense_account_id": journal.factoring_expense_account_id,
+            "factoring_expense_tax_account_id": (
+                journal.factoring_expense_tax_account_id
+            ),
+        }
+        missing = [
+            journal._fields[field].string
+            for field, account in accounts.items()
+            if not account
+        ]
+        if missing:
+            raise UserError(
+                _("Missing accounts on journal %(journal)s: %(accounts)s")
+                % {"journal": journal.display_name, "accounts": ", ".join(missing)}
+            )
+        company = self.company_id
+        currency = self.currency_id or company.currency_id
+        date = self.date or fields.Date.context_today(self)
+
+        def convert(amount):
+            return currency._convert(amount, company.currency_id, company, date)
+
+        def line(name, account, amount, balance=None):
+            "amount is in the currency of the receipt"
+            return Command.create(
+                {
+                    "name": name,
+                    "account_id": account.id,
+                    "currency_id": currency.id,
+                    "amount_currency": amount,
+                    "balance": convert(amount) if balance is None else balance,
+                }
+            )
+
+        transfer_lines = []
+        totals = defaultdict(lambda: [0.0, 0.0])
+        for key, name, residual, residual_currency, line_ids in groups:
+            account_id, partner_id, currency_id = key
+            transfer_lines.append(
+                Command.create(
+                    {
+                        "name": name,
+                        "account_id": account_id,
+                        "partner_id": partner_id,
+                        "currency_id": currency_id,
+                        "amount_currency": -residual_currency,
+                        "balance": -residual,
+                        # identifies the group of the transfer line
+                        "factor_origin_line_id": min(line_ids),
+                    }
+                )
+            )
+            totals[currency_id][0] += residual
+            totals[currency_id][1] += residual_currency
+        for currency_id, (residual, residual_currency) in totals.items():
+            transfer_lines.append(
+                Command.create(
+                    {
+                        "name": self.display_name,
+                        "account_id": accounts["factoring_receivable_account_id"].id,
+                        "currency_id": currency_id,
+                        "amount_currency": residual_currency,
+                        "balance": residual,
+                    }
+                )
+            )
+        expenses = self.expense_untaxed_amount + self.expense_tax_amount
+        moves = [
+            (_("Transfer"), transfer_lines),
+            (
+                _("Holdback"),
+                [
+                    line(
+                        _("Holdback"),
+                        accounts["factoring_holdback_account_id"],
+                        self.holdback_amount,
+                    ),
+                    line(
+                        _("Holdback"),
+                        accounts["factoring_current_account_id"],
+                        -self.holdback_amount,
+                    ),
+                ],
+            ),
+            (
+                _("Fees"),
+                [
+                    line(
+                        _("Fees"),
+                        accounts["factoring_expense_account_id"],
+                        self.expense_untaxed_amount,
+                    ),
+                    line(
+                        _("Fees VAT"),
+                        accounts["factoring_expense_tax_account_id"],
+                        self.expense_tax_amount,
+                    ),
+                    # balanced whatever the rounding of the conversions
+                    line(
+                        _("Fees"),
+                        accounts["factoring_current_account_id"],
+                        -expenses,
+                        balance=-convert(self.expense_untaxed_amount)
+                        - convert(self.expense_tax_amount),
+                    ),
+                ],
+            ),
+        ]
+        return [
+            {
+                "move_type": "entry",
+                "journal_id": journal.id,
+                "date": date,
+                "ref": f"{self.display_name} - {label}",
+                "line_ids": line_ids,
+            }
+            for label, line_ids in moves
+            if line_ids
+        ]
+
+    def _post_factor_moves(self):
+        """Create the moves in bulk and reconcile the receivables
+        by batches of account, partner and currency"""
+        self.ensure_one()
+        groups = self._get_transfer_groups()
+        moves = self.env["account.move"].create(self._prepare_factor_moves_vals(groups))
+        moves.action_post()
+        self.move_ids = [Command.set(moves.ids)]
+        if not groups:
+            return moves
+        transfer_lines = {
+            line.factor_origin_line_id.id: line
+            for line in moves.line_ids
+            if line.factor_origin_line_id
+        }
+        aml_model = self.env["account.move.line"]
+        batches = defaultdict(lambda: aml_model)
+        for key, __, __, __, line_ids in groups:
+            batches[key] |= aml_model.browse(line_ids) | transfer_lines[min(line_ids)]
+        for lines in batches.values():
+            lines.reconcile()
+        return moves
+
     def action_goto_moves(self):
         self.ensure_one()
         return {
             "name": _("Subrogation Receipt %s") % self.display_name,
             "res_model": "account.move.line",
             "view_mode": "tree,form",
-            "domain": "[('subrogation_id', '=', %s)]" % self.id,
+            "domain": [("subrogation_id", "=", self.id)],
+            "context": {"create": False},
             "type": "ir.actions.act_window",
         }
 
+    def write(self, vals):
+        fnames = FACTOR_MOVES_FIELDS.intersection(vals)
+        if fnames:
+            for rec in self.filtered("move_ids"):
+                currency = rec.currency_id or rec.company_id.currency_id
+                if any(
+                    currency.compare_amounts(rec[fname], vals[fname] or 0.0)
+                    for fname in fnames
+                ):
+                    raise UserError(
+                        _(
+                            "The factor entries of %s are generated: its holdback "
+                            "and fee amounts can't be changed anymore"
+                        )
+                        % rec.display_name
+                    )
+        return super().write(vals)
+
     def unlink(self):
         for rec in self:
             if rec.state == "posted":
                 raise UserError(_("Subrogations in Posted state can't be deleted"))
-        return super().unlink()
+        # lines are freed by the foreign key, their write_date is unchanged
+        self.env["account.move.line"].flush_model(["subrogation_id"])
+        self.env.cr.execute(
+            """
+            SELECT DISTINCT factor_journal_id FROM account_move_line
+            WHERE subrogation_id = ANY(%s) AND factor_journal_id IS NOT NULL
+            """,
+            (self.ids,),
+        )
+        journals = self.factor_journal_id | self.env["account.journal"].browse(
+            [row[0] for row in self.env.cr.fetchall()]
+        )
+        res = super().unlink()
+        self._reset_compute_watermark(journals)
+        return res
 
     def _get_company_id(self):
         return self.env.company.id
@@ -0,0 +1,198 @@
+# © 2024 David BEAL @ Akretion
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import logging
+
+from psycopg2 import OperationalError
+
+from odoo import SUPERUSER_ID, _, api, fields, models
+from odoo.exceptions import UserError
+from odoo.service.model import PG_CONCURRENCY_ERRORS_TO_RETRY
+
+_logger = logging.getLogger(__name__)
+
+# receipt method called by each job action
+JOB_ACTIONS = {
+    "compute": "action_compute_lines",
+    "confirm": "action_confirm",
+}
+MAX_ATTEMPTS = 5
+
+
+class SubrogationReceiptJob(models.Model):
+    _name = "subrogation.receipt.job"
+    _description = "Background execution of subrogation receipt actions"
+    _order = "id DESC"
+
+    receipt_id = fields.Many2one(
+        comodel_name="subrogation.receipt",
+        string="Subrogation Receipt",
+        required=True,
+        index=True,
+        ondelete="cascade",
+    )
+    company_id = fields.Many2one(related="receipt_id.company_id", store=True)
+    user_id = fields.Many2one(
+        comodel_name="res.users",
+        string="User",
+        default=lambda s: s.env.uid,
+        required=True,
+        help="The action is executed with the rights of this user",
+    )
+    action = fields.Selection(
+        [("compute", "Compute"), ("confirm", "Confirm")],
+        required=True,
+    )
+    state = fields.Selection(
+        [
+            ("pending", "Pending"),
+            ("running", "Running"),
+            ("done", "Done"),
+            ("failed", "Failed"),
+        ],
+        default="pending",
+        required=True,
+        index=True,
+    )
+    attempts = fields.Integer(readonly=True)
+    lines_selected = fields.Integer(readonly=True)
+    rows_written = fields.Integer(readonly=True)
+    date_started = fields.Datetime(readonly=True)
+    date_done = fields.Datetime(readonly=True)
+    error = fields.Text(readonly=True)
+
+    def init(self):
+        # a receipt is processed by one job at a time
+        self.env.cr.execute(
+            """
+            CREATE UNIQUE INDEX IF NOT EXISTS subrogation_receipt_job_active_uniq
+            ON subrogation_receipt_job (receipt_id)
+            WHERE state IN ('pending', 'running')
+            """
+        )
+
+    @api.model
+    def _enqueue(self, receipts, action):
+        "Queue `action` on `receipts` and wake up the cron"
+        active = self.search(
+            [
+                ("receipt_id", "in", receipts.ids),
+                ("state", "in", ("pending", "running")),
+            ]
+        )
+        if active:
+            raise UserError(
+                _("A job is already queued for %s")
+                % ", ".join(active.receipt_id.mapped("display_name"))
+            )
+        jobs = self.create(
+            [{"receipt_id": receipt.id, "action": action} for receipt in receipts]
+        )
+        self._trigger_cron()
+        return jobs
+
+    @api.model
+    def _trigger_cron(self):
+        self.env.ref(
+            "account_factoring_receivable_balance.cron_subrogation_receipt_job"
+        )._trigger()
+
+    @api.model
+    def _cron_run_jobs(self, limit=20):
+        "Each job runs and is committed in its own transaction"
+        for __ in range(limit):
+            job = self._acquire()
+            if not job:
+                break
+            job._run()
+
+    @api.model
+    def _acquire(self):
+        """Take the oldest pending job, skipping the ones taken
+        by concurrent workers"""
+        cr = self.env.cr
+        cr.execute(
+            """
+            SELECT id FROM subrogation_receipt_job
+            WHERE state = 'pending'
+            ORDER BY id
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED
+            """
+        )
+        row = cr.fetchone()
+        if not row:
+            return self.browse()
+        job = self.browse(row[0])
+        job.write(
+            {
+                "state": "running",
+                "date_started": fields.Datetime.now(),
+                "attempts": job.attempts + 1,
+                "error": False,
+            }
+        )
+        cr.commit()  # pylint: disable=invalid-commit
+        return job
+
+    def _run(self):
+        self.ensure_one()
+        cr = self.env.cr
+        receipt = self.receipt_id.with_user(self.user_id).with_company(
+            self.company_id.id
+        )
+        receipt = receipt.with_context(subrogation_job_id=self.id)
+        try:
+            # the receipt lock is held until the commit of the work:
+            # synchronous actions on the same receipt wait for it
+            cr.execute(
+                # other transactions may still insert rows referencing
+                # the receipt: its key is not locked
+                "SELECT id FROM subrogation_receipt WHERE id = %s "
+                "FOR NO KEY UPDATE NOWAIT",
+                (receipt.id,),
+            )
+            getattr(receipt, JOB_ACTIONS[self.action])()
+            self.env.flush_all()
+            cr.commit()  # pylint: disable=invalid-commit
+        except OperationalError as e:
+            cr.rollback()
+            self.env.invalidate_all()
+            if e.pgcode in PG_CONCURRENCY_ERRORS_TO_RETRY and (
+                self.attempts < MAX_ATTEMPTS
+            ):
+                _logger.info("Job %s: concurrent update, retry later", self.id)
+                self.write({"state": "pending", "error": str(e)})
+                # in case the current cron call ends before taking it again
+                self._trigger_cron()
+            else:
+                self._set_failed(e)
+            cr.commit()  # pylint: disable=invalid-commit
+            return
+        except Exception as e:
+            cr.rollback()
+            self.env.invalidate_all()
+            _logger.exception("Job %s failed", self.id)
+            self._set_failed(e)
+            cr.commit()  # pylint: disable=invalid-commit
+            return
+        self.write({"state": "done", "date_done": fields.Datetime.now()})
+        cr.commit()  # pylint: disable=invalid-commit
+
+    def _set_failed(self, error):
+        self.write(
+            {"state": "failed", "error": str(error), "date_done": fields.Datetime.now()}
+        )
+
+    @api.model
+    def _report_progress(self, job_id, vals):
+        """Write the progress of a running job in a separate transaction,
+        so it is visible before the end of the job"""
+        with self.env.registry.cursor() as cr:
+            env = api.Environment(cr, SUPERUSER_ID, {})
+            env[self._name].browse(job_id).write(vals)
+
+    def action_retry(self):
+        for rec in self:
+            if rec.state == "failed":
+                self._enqueue(rec.receipt_id, rec.action)
@@ -0,0 +1,99 @@
+# © 2024 David BEAL @ Akretion
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import logging
+from datetime import timedelta
+from functools import partial
+
+import psycopg2
+
+from odoo import SUPERUSER_ID, api, fields, models
+
+_logger = logging.getLogger(__name__)
+
+# days the measures are kept, see _gc_perf
+RETENTION_DAYS = 30
+# key of the measures waiting for the end of the transaction
+PENDING_KEY = "subrogation.receipt.perf"
+
+
+class SubrogationReceiptPerf(models.Model):
+    _name = "subrogation.receipt.perf"
+    _description = "Timings of the processing phases of subrogation receipts"
+    _order = "id DESC"
+
+    receipt_id = fields.Many2one(
+        comodel_name="subrogation.receipt",
+        string="Subrogation Receipt",
+        required=True,
+        index=True,
+        ondelete="cascade",
+    )
+    action = fields.Char(required=True, help="Action the phase belongs to")
+    name = fields.Char(string="Phase", required=True)
+    duration = fields.Float(digits=(16, 3), help="Wall time in seconds")
+    query_count = fields.Integer(string="Queries")
+    query_time = fields.Float(
+        digits=(16, 3), help="Time spent in SQL queries in seconds"
+    )
+    rows = fields.Integer(help="Rows processed by the phase")
+    plan = fields.Text(string="Query Plan")
+    error = fields.Text(help="Error which interrupted the phase")
+
+    @api.model
+    def _store(self, vals):
+        """Store measures at the end of the transaction of the phase:
+        in this transaction when it is committed, as another one can't see
+        a receipt it created. When it is rolled back, the measures of the
+        receipts which still exist are stored in a separate transaction"""
+        cr = self.env.cr
+        pending = cr.precommit.data.get(PENDING_KEY)
+        if pending is None:
+            pending = cr.precommit.data[PENDING_KEY] = []
+            cr.precommit.add(partial(self._create_pending, cr, pending))
+            cr.postrollback.add(
+                partial(self._store_pending, self.env.registry, pending)
+            )
+        pending.append(vals)
+
+    @api.model
+    def _store_pending(self, registry, pending):
+        "Store the pending measures in a new transaction"
+        try:
+            with registry.cursor() as cr:
+                self._create_pending(cr, pending)
+        except psycopg2.Error as e:
+            _logger.info("Measures of subrogations not stored: %s", e)
+
+    @api.model
+    def _create_pending(self, cr, pending):
+        "Create the pending measures of the existing receipts on cr"
+        vals_list, pending[:] = pending[:], []
+        if not vals_list:
+            return
+        env = api.Environment(cr, SUPERUSER_ID, {})
+        receipt_ids = (
+            env["subrogation.receipt"]
+            .browse(list({vals["receipt_id"] for vals in vals_list}))
+            .exists()
+            .ids
+        )
+        env[self._name].create(
+            [vals for vals in vals_list if vals["receipt_id"] in receipt_ids]
+        )
+        # precommit hooks run after the flush of the transaction
+        env[self._name].flush_model()
+
+    @api.autovacuum
+    def _gc_perf(self):
+        "Delete the measures older than the retention period"
+        days = int(
+            self.env["ir.config_parameter"]
+            .sudo()
+            .get_param(
+                "account_factoring_receivable_balance.perf_retention_days",
+                RETENTION_DAYS,
+            )
+        )
+        limit = fields.Datetime.now() - timedelta(days=days)
+        self.sudo().search([("create_date", "<", limit)]).unlink()
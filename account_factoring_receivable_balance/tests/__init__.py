@@ -1 +1,8 @@
 from . import test_module
+from . import test_claim
+from . import test_record_layout
+from . import test_validation
+from . import test_return_import
+from . import test_post
+from . import test_concurrency
+from . import test_perf
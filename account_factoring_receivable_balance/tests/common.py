@@ -0,0 +1,80 @@
+# © 2024 David BEAL @ Akretion
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+from unittest.mock import patch
+
+from odoo.addons.account.tests.common import AccountTestInvoicingCommon
+
+# factor types are brought by the factor modules: tests of the generic
+# module use their own
+FACTOR_TYPE = "test"
+
+
+def patch_factor_type(env):
+    "Patcher adding FACTOR_TYPE to the selection of account.journal"
+    field = env["account.journal"]._fields["factor_type"]
+    return patch.object(
+        field, "selection", list(field.selection) + [(FACTOR_TYPE, "Test Factor")]
+    )
+
+
+def create_factor_journal(env, company, code="TFAC"):
+    "Factor journal of FACTOR_TYPE with its accounts"
+    accounts = env["account.account"].create(
+        [
+            {
+                "code": f"{code}{index}",
+                "name": f"{code} {name}",
+                "account_type": account_type,
+                "reconcile": account_type == "asset_current",
+                "company_id": company.id,
+            }
+            for index, (name, account_type) in enumerate(
+                [
+                    ("Receivable", "asset_current"),
+                    ("Current", "liability_current"),
+                    ("Holdback", "asset_current"),
+                    ("Expense", "expense"),
+                    ("Expense Tax", "asset_current"),
+                ]
+            )
+        ]
+    )
+    return env["account.journal"].create(
+        {
+            "name": f"Factor {code}",
+            "code": code,
+            "type": "general",
+            "factor_type": FACTOR_TYPE,
+            "company_id": company.id,
+            "factoring_receivable_account_id": accounts[0].id,
+            "factoring_current_account_id": accounts[1].id,
+            "factoring_holdback_account_id": accounts[2].id,
+            "factoring_expense_account_id": accounts[3].id,
+            "factoring_expense_tax_account_id": accounts[4].id,
+        }
+    )
+
+
+class FactorCommon(AccountTestInvoicingCommon):
+    @classmethod
+    def setUpClass(cls, chart_template_ref=None):
+        super().setUpClass(chart_template_ref=chart_template_ref)
+        cls.startClassPatcher(patch_factor_type(cls.env))
+        cls.env.user.groups_id |= cls.env.ref("account.group_account_manager")
+        cls.company = cls.company_data["company"]
+        cls.journal = create_factor_journal(cls.env, cls.company)
+        cls.partners, cls.moves = cls.company._prepare_data_for_factor(
+            cls.journal, partner_count=3, move_count=12
+        )
+
+    @classmethod
+    def receivable_lines(cls, moves):
+        return moves.line_ids.filtered(
+            lambda s: s.account_id.account_type == "asset_receivable"
+        )
+
+    def create_receipt(self, **vals):
+        return self.env["subrogation.receipt"].create(
+            dict(vals, factor_journal_id=self.journal.id)
+        )
@@ -0,0 +1,101 @@
+# © 2024 David BEAL @ Akretion
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+from odoo.tests import tagged
+
+from .common import FactorCommon, create_factor_journal
+
+
+@tagged("post_install", "-at_install")
+class TestClaim(FactorCommon):
+    def test_claim(self):
+        receipt = self.create_receipt()
+        receipt.action_compute_lines()
+        lines = self.receivable_lines(self.moves)
+        self.assertEqual(receipt.line_ids, lines)
+        self.assertEqual(receipt.line_count, len(lines))
+        self.assertAlmostEqual(receipt.balance, sum(lines.mapped("amount_currency")))
+
+    def test_release(self):
+        "Lines which are not eligible anymore are released"
+        receipt = self.create_receipt()
+        receipt.action_compute_lines()
+        skipped = self.moves[0]
+        skipped.skip_factor = True
+        receipt.action_compute_lines_full()
+        self.assertEqual(receipt.line_ids, self.receivable_lines(self.moves[1:]))
+        self.assertFalse(self.receivable_lines(skipped).subrogation_id)
+
+    def test_lines_of_another_receipt(self):
+        "Lines of another receipt are neither claimed nor released"
+        other = self.create_receipt()
+        other.action_compute_lines()
+        other.state = "confirmed"
+        receipt = self.create_receipt()
+        receipt.action_compute_lines()
+        self.assertFalse(receipt.line_ids)
+        self.assertEqual(other.line_ids, self.receivable_lines(self.moves))
+
+    def test_delta_after_unlink(self):
+        "Lines freed by the deletion of their receipt are claimed by a delta"
+        other = self.create_receipt()
+        other.action_compute_lines()
+        other.state = "confirmed"
+        # claimed in a past transaction, before the computation below
+        self.env.flush_all()
+        self.env.cr.execute(
+            """
+            UPDATE account_move_line
+            SET write_date = write_date - interval '1 day'
+            WHERE move_id = ANY(%(ids)s);
+            UPDATE account_move
+            SET write_date = write_date - interval '1 day'
+            WHERE id = ANY(%(ids)s)
+            """,
+            {"ids": self.moves.ids},
+        )
+        self.env.invalidate_all()
+        receipt = self.create_receipt()
+        receipt.action_compute_lines()
+        self.assertFalse(receipt.line_ids)
+        other.unlink()
+        receipt.action_compute_lines()
+        delta_lines = receipt.line_ids
+        receipt.action_compute_lines_full()
+        self.assertEqual(delta_lines, receipt.line_ids)
+        self.assertEqual(delta_lines, self.receivable_lines(self.moves))
+
+    def test_preview(self):
+        "The preview counts the lines a computation would claim, by currency"
+        receipt = self.create_receipt()
+        preview = receipt._get_selection_preview()
+        lines = self.receivable_lines(self.moves)
+        self.assertEqual(preview["count"], len(lines))
+        self.assertEqual(
+            [row["currency"] for row in preview["totals"]], [lines.currency_id]
+        )
+        self.assertAlmostEqual(
+            preview["totals"][0]["total"], sum(lines.mapped("amount_currency"))
+        )
+        self.assertFalse(receipt.line_ids)
+        wizard = self.env["subrogation.selection.preview"].with_context(
+            default_receipt_id=receipt.id
+        )
+        values = wizard.default_get(["receipt_id", "line_count", "preview"])
+        self.assertEqual(values["line_count"], len(lines))
+
+    def test_property_reset(self):
+        "A factor journal property only resets the drafts of its journals"
+        journal, other_journal = (
+            create_factor_journal(self.env, self.company, code)
+            for code in ("TFA2", "TFA3")
+        )
+        receipt, other = self.env["subrogation.receipt"].create(
+            [{"factor_journal_id": journal.id}, {"factor_journal_id": other_journal.id}]
+        )
+        receipt.action_compute_lines()
+        other.action_compute_lines()
+        self.assertTrue(receipt.last_compute_date)
+        self.partners[0].with_company(self.company).factor_journal_id = journal
+        self.assertFalse(receipt.last_compute_date)
+        self.assertTrue(other.last_compute_date)
@@ -0,0 +1,194 @@
+# © 2024 David BEAL @ Akretion
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+"""Claims of subrogation receipts in concurrent transactions.
+
+Each transaction has its own connection and data is committed, then
+deleted at the end of the class: run it on a disposable database only
+
+    odoo -i account_factoring_receivable_balance --test-enable \
+        --test-tags factoring_concurrency
+"""
+
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2
+
+from odoo import SUPERUSER_ID, api, sql_db
+from odoo.tests import TransactionCase, tagged
+
+from .common import create_factor_journal, patch_factor_type
+
+
+@tagged("-standard", "-at_install", "post_install", "factoring_concurrency")
+class TestClaimConcurrency(TransactionCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.startClassPatcher(patch_factor_type(cls.env))
+        company = cls.env.ref("base.main_company")
+        if not company.chart_template_id:
+            raise unittest.SkipTest("A chart of accounts is required")
+        cls.units = []
+        cls.journal_ids = []
+        cls.partner_ids = []
+        cls.move_ids = []
+        cr = cls.new_cursor()
+        try:
+            env = api.Environment(cr, SUPERUSER_ID, {})
+            company = company.with_env(env)
+            for index in range(2):
+                journal = create_factor_journal(env, company, code=f"TCC{index}")
+                cls.journal_ids.append(journal.id)
+                partners, moves = company._prepare_data_for_factor(
+                    journal, partner_count=3, move_count=50
+                )
+                cls.partner_ids += partners.ids
+                cls.move_ids += moves.ids
+                cls.units.append((company.id, journal.id))
+            cr.commit()
+        finally:
+            cr.close()
+
+    @classmethod
+    def tearDownClass(cls):
+        "Delete the committed data"
+        cr = cls.new_cursor()
+        try:
+            env = api.Environment(cr, SUPERUSER_ID, {})
+            env["subrogation.receipt"].search(
+                [("factor_journal_id", "in", cls.journal_ids)]
+            ).unlink()
+            moves = env["account.move"].browse(cls.move_ids).exists()
+            moves.button_draft()
+            moves.with_context(force_delete=True).unlink()
+            env["res.partner"].browse(cls.partner_ids).exists().unlink()
+            journals = env["account.journal"].browse(cls.journal_ids).exists()
+            accounts = journals.mapped(
+                lambda s: s.factoring_receivable_account_id
+                | s.factoring_current_account_id
+                | s.factoring_holdback_account_id
+                | s.factoring_expense_account_id
+                | s.factoring_expense_tax_account_id
+            )
+            journals.unlink()
+            accounts.unlink()
+            cr.commit()
+        finally:
+            cr.close()
+        super().tearDownClass()
+
+    @classmethod
+    def new_cursor(cls):
+        "A cursor on its own connection, outside of the test transaction"
+        cr = sql_db.db_connect(cls.env.cr.dbname).cursor()
+        # a blocked transaction fails the test instead of hanging
+        cr.execute("SET lock_timeout = '10s'")
+        return cr
+
+    def run_parallel(self, *functions):
+        """Run each function(env) in its own transaction and thread,
+        return their results or exceptions"""
+
+        def run(function):
+            cr = self.new_cursor()
+            try:
+                env = api.Environment(cr, SUPERUSER_ID, {})
+                result = function(env)
+                cr.commit()
+                return result
+            except Exception as e:
+                cr.rollback()
+                return e
+            finally:
+                cr.close()
+
+        with ThreadPoolExecutor(max_workers=len(functions)) as executor:
+            return list(executor.map(run, functions))
+
+    def prepare_receipts(self, company_id, journal_id, vals_list):
+        """Committed receipts of the journal, existing drafts are confirmed
+        and their lines released"""
+        cr = self.new_cursor()
+        try:
+            env = api.Environment(
+                cr, SUPERUSER_ID, {"allowed_company_ids": [company_id]}
+            )
+            receipts = env["subrogation.receipt"]
+            cr.execute(
+                """
+                UPDATE account_move_line SET subrogation_id = NULL
+                WHERE subrogation_id IN (
+                    SELECT id FROM subrogation_receipt
+                    WHERE factor_journal_id = %s AND state = 'draft'
+                )
+                """,
+                (journal_id,),
+            )
+            receipts.search(
+                [("factor_journal_id", "=", journal_id), ("state", "=", "draft")]
+            ).write({"state": "confirmed"})
+            receipts = receipts.create(
+                [dict(vals, factor_journal_id=journal_id) for vals in vals_list]
+            )
+            cr.commit()
+            return receipts.ids
+        finally:
+            cr.close()
+
+    def claim(self, company_id, receipt_id):
+        def function(env):
+            env = env(context={"allowed_company_ids": [company_id]})
+            receipt = env["subrogation.receipt"].browse(receipt_id)
+            return set(receipt._claim_factor_lines())
+
+        return function
+
+    def test_parallel_journals(self):
+        "Receipts of different journals are computed without blocking"
+        claims = []
+        for company_id, journal_id in self.units:
+            receipt_ids = self.prepare_receipts(company_id, journal_id, [{}])
+            claims.append(self.claim(company_id, receipt_ids[0]))
+        results = self.run_parallel(*claims)
+        for result in results:
+            self.assertIsInstance(result, set)
+            self.assertTrue(result)
+        self.assertFalse(results[0] & results[1])
+
+    def test_no_double_claim(self):
+        "Lines locked by a concurrent claim are skipped, without waiting"
+        company_id, journal_id = self.units[0]
+        first_id, other_id = self.prepare_receipts(
+            company_id, journal_id, [{}, {"state": "confirmed"}]
+        )
+        cr = self.new_cursor()
+        try:
+            env = api.Environment(cr, SUPERUSER_ID, {})
+            # the claim of the first transaction isn't committed
+            first = self.claim(company_id, first_id)(env)
+            other = self.run_parallel(self.claim(company_id, other_id))[0]
+        finally:
+            cr.rollback()
+            cr.close()
+        self.assertTrue(first)
+        self.assertEqual(other, set())
+
+    def test_single_draft(self):
+        "Only one of concurrent draft creations for a journal succeeds"
+        company_id, journal_id = self.units[1]
+        self.prepare_receipts(company_id, journal_id, [])
+
+        def create(env):
+            env = env(context={"allowed_company_ids": [company_id]})
+            receipt = env["subrogation.receipt"].create(
+                {"factor_journal_id": journal_id}
+            )
+            env.flush_all()
+            return receipt.id
+
+        results = self.run_parallel(create, create)
+        errors = [result for result in results if isinstance(result, Exception)]
+        self.assertEqual(len(errors), 1)
+        self.assertIsInstance(errors[0], psycopg2.IntegrityError)
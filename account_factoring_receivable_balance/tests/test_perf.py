@@ -0,0 +1,22 @@
+# © 2024 David BEAL @ Akretion
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+from odoo.tests import tagged
+
+from .common import FactorCommon
+
+
+@tagged("post_install", "-at_install")
+class TestPerf(FactorCommon):
+    def test_new_receipt(self):
+        "Measures of a receipt created in the same transaction are stored"
+        receipt = self.create_receipt()
+        receipt.action_compute_lines()
+        perf_obj = self.env["subrogation.receipt.perf"]
+        self.assertFalse(perf_obj.search([("receipt_id", "=", receipt.id)]))
+        # hooks run by the commit of the transaction
+        self.env.cr.precommit.run()
+        perfs = perf_obj.search([("receipt_id", "=", receipt.id)])
+        self.assertEqual(set(perfs.mapped("action")), {"compute"})
+        self.assertIn("selection", perfs.mapped("name"))
+        self.assertFalse(any(perfs.mapped("error")))
@@ -0,0 +1,61 @@
+# © 2024 David BEAL @ Akretion
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+from odoo.exceptions import UserError
+from odoo.tests import tagged
+
+from .common import FactorCommon
+
+
+@tagged("post_install", "-at_install")
+class TestPost(FactorCommon):
+    def post_receipt(self):
+        receipt = self.create_receipt()
+        receipt.action_compute_lines()
+        receipt.write(
+            {
+                "state": "confirmed",
+                "holdback_amount": 100,
+                "expense_untaxed_amount": 10,
+                "expense_tax_amount": 2,
+            }
+        )
+        receipt.action_post()
+        return receipt
+
+    def assert_posted(self, receipt):
+        self.assertEqual(receipt.state, "posted")
+        self.assertEqual(set(receipt.move_ids.mapped("state")), {"posted"})
+        for move in receipt.move_ids:
+            self.assertAlmostEqual(sum(move.line_ids.mapped("balance")), 0)
+        self.assertTrue(all(receipt.line_ids.mapped("reconciled")))
+        transfer_lines = receipt.move_ids.line_ids.filtered("factor_origin_line_id")
+        for transfer_line in transfer_lines:
+            origin = transfer_line.factor_origin_line_id
+            self.assertIn(origin, receipt.line_ids)
+            self.assertTrue(transfer_line.reconciled)
+            self.assertEqual(
+                (transfer_line.account_id, transfer_line.partner_id),
+                (origin.account_id, origin.partner_id),
+            )
+        return transfer_lines
+
+    def test_post_by_partner(self):
+        receipt = self.post_receipt()
+        transfer_lines = self.assert_posted(receipt)
+        self.assertEqual(transfer_lines.partner_id, receipt.line_ids.partner_id)
+        self.assertEqual(len(transfer_lines), len(receipt.line_ids.partner_id))
+
+    def test_post_by_move(self):
+        self.journal.factor_post_grouping = "move"
+        receipt = self.post_receipt()
+        transfer_lines = self.assert_posted(receipt)
+        self.assertEqual(len(transfer_lines), len(receipt.line_ids.move_id))
+
+    def test_amounts_fixed_once_posted(self):
+        receipt = self.post_receipt()
+        receipt.holdback_amount = 100
+        with self.assertRaises(UserError):
+            receipt.holdback_amount = 90
+        with self.assertRaises(UserError):
+            receipt.expense_tax_amount = 3
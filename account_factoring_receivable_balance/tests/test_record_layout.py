@@ -0,0 +1,71 @@
+# © 2024 David BEAL @ Akretion
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+from datetime import date
+
+from odoo.tests import TransactionCase, tagged
+
+from ..tools import LayoutError, RecordLayout
+from ..tools import LayoutField as F
+
+
+@tagged("post_install", "-at_install")
+class TestRecordLayout(TransactionCase):
+    def layout(self, **kwargs):
+        return RecordLayout(
+            "Test",
+            [
+                F("code", 3, offset=0),
+                F(None, 2, value="AB", offset=3),
+                F("amount", 6, align="right", fill="0", ftype="int", offset=5),
+                F("date", 8, ftype="date", offset=11),
+            ],
+            **kwargs,
+        )
+
+    def test_encode(self):
+        layout = self.layout(width=19)
+        self.assertEqual(layout.names, ["code", "amount", "date"])
+        self.assertEqual(
+            layout.encode(["X", 42, date(2024, 1, 31)]), "X  AB00004220240131"
+        )
+        self.assertEqual(
+            layout.encode_dict({"code": False, "amount": None, "date": False}),
+            "   AB000000" + " " * 8,
+        )
+
+    def test_separator(self):
+        layout = RecordLayout(
+            "Test",
+            [F("a", 2), F("b", 3, offset=3)],
+            width=7,
+            separator=";",
+            terminator=";",
+        )
+        self.assertEqual(layout.encode(["x", "yz"]), "x ;yz ;")
+
+    def test_wrong_offset(self):
+        with self.assertRaisesRegex(LayoutError, "'amount' starts at 5 instead of 4"):
+            RecordLayout("Test", [F("code", 5), F("amount", 3, offset=4)])
+
+    def test_wrong_width(self):
+        with self.assertRaisesRegex(LayoutError, "19 chars instead of 20"):
+            self.layout(width=20)
+
+    def test_wrong_constant(self):
+        with self.assertRaisesRegex(LayoutError, "constant 'ABC' is not 2"):
+            RecordLayout("Test", [F(None, 2, value="ABC")])
+
+    def test_wrong_declaration(self):
+        with self.assertRaises(LayoutError):
+            F("code", 3, align="center")
+        with self.assertRaises(LayoutError):
+            F("code", 3, ftype="float")
+
+    def test_value_too_wide(self):
+        layout = self.layout()
+        with self.assertRaises(LayoutError) as error:
+            layout.encode(["TOOLONG", 1, False])
+        self.assertEqual(error.exception.row, "TOOLONGAB000001        ")
+        self.assertIn("code:TOOLONG(7!=3)", error.exception.details)
+        self.assertIn("amount:000001(6)", error.exception.details)
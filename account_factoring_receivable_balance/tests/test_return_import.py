@@ -0,0 +1,85 @@
+# © 2024 David BEAL @ Akretion
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import base64
+
+from odoo.exceptions import UserError
+from odoo.tests import tagged
+
+from .common import FactorCommon
+
+
+@tagged("post_install", "-at_install")
+class TestReturnImport(FactorCommon):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.receipt = cls.env["subrogation.receipt"].create(
+            {"factor_journal_id": cls.journal.id}
+        )
+        cls.receipt.action_compute_lines()
+        cls.invoice_lines = cls.receivable_lines(
+            cls.moves.filtered(lambda s: s.move_type == "out_invoice")
+        )
+
+    def import_file(self, rows):
+        content = "kind;ref;amount\n" + "\n".join(";".join(row) for row in rows)
+        wizard = self.env["subrogation.return.import"].create(
+            {
+                "receipt_id": self.receipt.id,
+                "file": base64.b64encode(content.encode()),
+                "filename": "return.csv",
+            }
+        )
+        wizard.action_import()
+        return wizard
+
+    def test_import(self):
+        paid, partial, other = self.invoice_lines[:3]
+        wizard = self.import_file(
+            [
+                ("payment", paid.move_name, str(paid.amount_residual_currency)),
+                ("payment", partial.move_name, "1,50"),
+                ("payment", "UNKNOWN/001", "10"),
+                ("holdback", "", "100"),
+                ("fee", "", "12.5"),
+                ("fee_tax", "", "2.5"),
+            ]
+        )
+        self.assertEqual(self.receipt.holdback_amount, 100)
+        self.assertEqual(self.receipt.expense_untaxed_amount, 12.5)
+        self.assertEqual(self.receipt.expense_tax_amount, 2.5)
+        self.assertIn("UNKNOWN/001", wizard.result)
+        self.assertTrue(paid.reconciled)
+        self.assertFalse(partial.reconciled)
+        self.assertAlmostEqual(
+            partial.amount_residual_currency,
+            partial.amount_currency - 1.5,
+        )
+        self.assertFalse(other.matched_credit_ids)
+        # each counterpart is reconciled with the line it was booked for
+        for line in paid | partial:
+            counterpart = line.matched_credit_ids.credit_move_id
+            self.assertEqual(counterpart.factor_origin_line_id, line)
+            self.assertEqual(counterpart.currency_id, line.currency_id)
+        moves = (paid | partial).matched_credit_ids.credit_move_id.move_id
+        self.assertEqual(moves.state, "posted")
+        current = moves.line_ids.filtered(
+            lambda s: s.account_id == self.journal.factoring_current_account_id
+        )
+        self.assertAlmostEqual(
+            sum(current.mapped("amount_currency")),
+            paid.amount_currency + 1.5,
+        )
+
+    def test_posted_receipt(self):
+        self.receipt.state = "posted"
+        with self.assertRaises(UserError):
+            self.import_file([("holdback", "", "100")])
+
+    def test_incorrect_amount(self):
+        line = self.invoice_lines[0]
+        with self.assertRaisesRegex(UserError, "Line 3: incorrect amount '1.2.3'"):
+            self.import_file(
+                [("holdback", "", "100"), ("payment", line.move_name, "1.2.3")]
+            )
@@ -0,0 +1,29 @@
+# © 2024 David BEAL @ Akretion
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+from odoo.tests import TransactionCase, tagged
+
+from ..tools import ValidationCollector
+
+
+@tagged("post_install", "-at_install")
+class TestValidationCollector(TransactionCase):
+    def test_collector(self):
+        issues = ValidationCollector()
+        self.assertFalse(issues)
+        partner = self.env.user.partner_id
+        issues.add("size", "Wrong size", partner, "ref")
+        issues.add("size", "Wrong size again", partner, "ref")
+        issues.add("size", "Wrong name size", partner, "name")
+        issues.add("empty", "Empty value")
+        self.assertTrue(issues)
+        self.assertEqual(len(issues), 3)
+        self.assertEqual(
+            issues.messages(), ["Wrong size", "Wrong name size", "Empty value"]
+        )
+        issue = issues.issues()[0]
+        self.assertEqual(
+            (issue.code, issue.model, issue.res_id, issue.field),
+            ("size", "res.partner", partner.id, "ref"),
+        )
+        self.assertIsNone(issues.issues()[2].model)
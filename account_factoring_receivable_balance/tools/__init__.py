@@ -0,0 +1,2 @@
+from .record_layout import LayoutError, LayoutField, RecordLayout
+from .validation import ValidationCollector, ValidationIssue
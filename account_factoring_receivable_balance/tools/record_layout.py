@@ -0,0 +1,187 @@
+# © 2024 David BEAL @ Akretion
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+"""Declarative layout of the records of the files sent to factors
+
+A record type is declared once as a list of fields. Widths and offsets
+are checked and constant fields rendered when the layout is built:
+encoding a row then only converts, pads and joins the values.
+"""
+
+
+class LayoutError(ValueError):
+    """Raised when a layout declaration or an encoded row is wrong"""
+
+    def __init__(self, message, row=None, details=None):
+        super().__init__(message)
+        self.row = row
+        self.details = details
+
+
+class LayoutField:
+    """Field of a record layout
+
+    name: key of the value, None for a constant field
+    width: number of chars
+    align: 'left' (value then fill chars) or 'right' (fill chars then value)
+    fill: padding char
+    offset: expected 0-based position in the row, checked at compile time
+    ftype: 'str', 'int' or 'date'
+    date_format: strftime format of 'date' fields
+    value: value of a constant field, fill chars when empty
+    """
+
+    __slots__ = (
+        "name",
+        "width",
+        "align",
+        "fill",
+        "offset",
+        "ftype",
+        "date_format",
+        "value",
+    )
+
+    def __init__(
+        self,
+        name,
+        width,
+        align="left",
+        fill=" ",
+        offset=None,
+        ftype="str",
+        date_format="%Y%m%d",
+        value=None,
+    ):
+        if align not in ("left", "right"):
+            raise LayoutError(f"Unknown alignment '{align}' for field '{name}'")
+        if ftype not in ("str", "int", "date"):
+            raise LayoutError(f"Unknown type '{ftype}' for field '{name}'")
+        self.name = name
+        self.width = width
+        self.align = align
+        self.fill = str(fill)
+        self.offset = offset
+        self.ftype = ftype
+        self.date_format = date_format
+        self.value = value
+
+    def converter(self):
+        "Return the function converting a value to an unpadded string"
+        if self.ftype == "date":
+            date_format = self.date_format
+
+            def convert(value):
+                return value.strftime(date_format) if value else ""
+
+        elif self.ftype == "int":
+
+            def convert(value):
+                return "" if value is None or value is False else str(int(value))
+
+        else:
+
+            def convert(value):
+                if value is None or value is False:
+                    return ""
+                return value if isinstance(value, str) else str(value)
+
+        return convert
+
+    def encoder(self, index):
+        "Return the function encoding the value at index of the row values"
+        convert = self.converter()
+        just = str.ljust if self.align == "left" else str.rjust
+        width, fill = self.width, self.fill
+
+        def encode(values):
+            return just(convert(values[index]), width, fill)
+
+        return encode
+
+    def render(self, value):
+        "Convert and pad a value"
+        just = str.ljust if self.align == "left" else str.rjust
+        return just(self.converter()(value), self.width, self.fill)
+
+
+class RecordLayout:
+    """Record type compiled from its fields declaration
+
+    Values are given to `encode()` as a sequence following the order of
+    the named fields (`names`) or to `encode_dict()` as a mapping.
+    """
+
+    def __init__(self, name, fields, width=None, separator="", terminator=""):
+        self.name = name
+        self.fields = fields
+        self.separator = separator
+        self.terminator = terminator
+        self.names = [field.name for field in fields if field.name]
+        self.width = self._check_offsets(width)
+        self._encoders = self._compile()
+
+    def _check_offsets(self, width):
+        offset = 0
+        for field in self.fields:
+            if field.offset is not None and field.offset != offset:
+                raise LayoutError(
+                    f"Layout {self.name}: field '{field.name}' starts at "
+                    f"{offset} instead of {field.offset}"
+                )
+            offset += field.width + len(self.separator)
+        total = offset - len(self.separator) + len(self.terminator)
+        if width is not None and total != width:
+            raise LayoutError(
+                f"Layout {self.name}: fields make {total} chars instead of {width}"
+            )
+        return total
+
+    def _compile(self):
+        encoders = []
+        index = 0
+        for field in self.fields:
+            if not field.name:
+                text = field.render(field.value)
+                if len(text) != field.width:
+                    raise LayoutError(
+                        f"Layout {self.name}: constant '{text}' is not "
+                        f"{field.width} chars wide"
+                    )
+                encoders.append(lambda values, text=text: text)
+                continue
+            encoders.append(field.encoder(index))
+            index += 1
+        return encoders
+
+    def encode(self, values):
+        "Return the row of the values, raise LayoutError if too wide"
+        row = (
+            self.separator.join([encoder(values) for encoder in self._encoders])
+            + self.terminator
+        )
+        if len(row) != self.width:
+            raise LayoutError(
+                f"Layout {self.name}: row of {len(row)} chars "
+                f"instead of {self.width}",
+                row=row,
+                details=self._explain(values),
+            )
+        return row
+
+    def encode_dict(self, values):
+        return self.encode([values[name] for name in self.names])
+
+    def _explain(self, values):
+        "Debugging string with the size of each field: only built on error"
+        parts = []
+        index = 0
+        for field in self.fields:
+            value = field.value
+            if field.name:
+                value = values[index]
+                index += 1
+            text = field.render(value)
+            flag = "" if len(text) == field.width else f"!={field.width}"
+            parts.append(f"{field.name or ''}:{text}({len(text)}{flag})")
+        return "|".join(parts)
@@ -0,0 +1,36 @@
+# © 2024 David BEAL @ Akretion
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+from collections import namedtuple
+
+ValidationIssue = namedtuple("ValidationIssue", "code message model res_id field")
+
+
+class ValidationCollector:
+    """Collect the data issues found while building a factor file
+
+    An issue is identified by its code, record and field: adding it again
+    is a no-op, so the same problem is only reported once.
+    """
+
+    def __init__(self):
+        self._issues = {}
+
+    def add(self, code, message, record=None, field=None):
+        model = record._name if record else None
+        res_id = record.id if record else None
+        key = (code, model, res_id, field)
+        if key not in self._issues:
+            self._issues[key] = ValidationIssue(code, message, model, res_id, field)
+
+    def __bool__(self):
+        return bool(self._issues)
+
+    def __len__(self):
+        return len(self._issues)
+
+    def issues(self):
+        return list(self._issues.values())
+
+    def messages(self):
+        return [issue.message for issue in self._issues.values()]
@@ -0,0 +1,2 @@
+from . import subrogation_return_import
+from . import subrogation_selection_preview
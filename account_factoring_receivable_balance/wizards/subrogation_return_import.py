@@ -0,0 +1,263 @@
+# © 2024 David BEAL @ Akretion
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import csv
+import io
+from collections import defaultdict, namedtuple
+
+from odoo import Command, _, fields, models
+from odoo.exceptions import UserError
+from odoo.tools import float_compare, split_every
+
+# An entry of a factor return file:
+# kind is one of 'payment', 'holdback', 'fee', 'fee_tax', 'financed',
+# ref is the piece reference of payments
+ReturnEntry = namedtuple("ReturnEntry", "kind ref amount")
+
+# receipt amounts filled by the entries of these kinds
+AMOUNT_FIELDS = {
+    "holdback": "holdback_amount",
+    "fee": "expense_untaxed_amount",
+    "fee_tax": "expense_tax_amount",
+}
+# lines of the counterpart moves of payments
+MOVE_BATCH = 5000
+# unmatched references displayed
+MAX_UNMATCHED = 50
+
+
+class SubrogationReturnImport(models.TransientModel):
+    _name = "subrogation.return.import"
+    _description = "Import of the return file of a factor"
+
+    receipt_id = fields.Many2one(
+        comodel_name="subrogation.receipt",
+        string="Subrogation Receipt",
+        required=True,
+        ondelete="cascade",
+    )
+    file = fields.Binary(required=True, attachment=True)
+    filename = fields.Char()
+    encoding = fields.Char(default="utf-8", required=True)
+    state = fields.Selection([("draft", "Draft"), ("done", "Done")], default="draft")
+    result = fields.Text(readonly=True)
+
+    def _open_file(self):
+        "Binary stream of the uploaded file, read from the filestore"
+        attachment = (
+            self.env["ir.attachment"]
+            .sudo()
+            .search(
+                [
+                    ("res_model", "=", self._name),
+                    ("res_field", "=", "file"),
+                    ("res_id", "=", self.id),
+                ],
+                limit=1,
+            )
+        )
+        if attachment.store_fname:
+            return open(attachment._full_path(attachment.store_fname), "rb")
+        return io.BytesIO(attachment.raw or b"")
+
+    def _parse_factor_return(self, stream):
+        """Yield the ReturnEntry of the file, by the parser of the factor
+        type if any, i.e. _parse_factor_return_bpce"""
+        method = f"_parse_factor_return_{self.receipt_id.factor_type}"
+        if hasattr(self, method):
+            return getattr(self, method)(stream)
+        return self._parse_factor_return_csv(stream)
+
+    def _parse_factor_return_csv(self, stream):
+        """Generic format: kind;ref;amount with an optional header,
+        amount with . or , as decimal separator"""
+        text = io.TextIOWrapper(stream, encoding=self.encoding, newline="")
+        reader = csv.reader(text, delimiter=";")
+        for row in reader:
+            if not row or row[0].strip().lower() in ("", "kind"):
+                continue
+            if len(row) < 3:
+                raise UserError(
+                    _("Line %(line)s is incorrect: %(row)s")
+                    % {"line": reader.line_num, "row": ";".join(row)}
+                )
+            try:
+                amount = float(row[2].strip().replace(",", ".") or 0)
+            except ValueError as e:
+                raise UserError(
+                    _("Line %(line)s: incorrect amount '%(amount)s'")
+                    % {"line": reader.line_num, "amount": row[2]}
+                ) from e
+            yield ReturnEntry(row[0].strip().lower(), row[1].strip(), amount)
+
+    def _get_return_ref(self, move_name):
+        "Reference of a piece in the return files of the factor"
+        return move_name
+
+    def _get_return_index(self):
+        """Open lines of the receipt by piece reference
+        and their residual amount"""
+        self.env.flush_all()
+        self.env.cr.execute(
+            """
+            SELECT aml.id, aml.move_name, aml.amount_residual_currency
+            FROM account_move_line aml
+            WHERE aml.subrogation_id = %s AND NOT aml.reconciled
+            """,
+            (self.receipt_id.id,),
+        )
+        index = {}
+        residuals = {}
+        for line_id, move_name, residual in self.env.cr.fetchall():
+            index.setdefault(self._get_return_ref(move_name), line_id)
+            residuals[line_id] = residual
+        return index, residuals
+
+    def action_import(self):
+        self.ensure_one()
+        receipt = self.receipt_id
+        if receipt.state == "posted" or any(
+            move.state == "posted" for move in receipt.move_ids
+        ):
+            raise UserError(
+                _(
+                    "The factor entries of %s are posted: "
+                    "its return file can't be imported anymore"
+                )
+                % receipt.display_name
+            )
+        index, residuals = self._get_return_index()
+        amounts = defaultdict(float)
+        # line id: amount paid to the factor
+        payments = defaultdict(float)
+        unmatched = []
+        count = 0
+        with self._open_file() as stream:
+            for entry in self._parse_factor_return(stream):
+                count += 1
+                if entry.kind != "payment":
+                    amounts[entry.kind] += entry.amount
+                    continue
+                line_id = index.get(entry.ref)
+                if not line_id:
+                    unmatched.append(entry.ref)
+                    continue
+                payments[line_id] += entry.amount
+        vals = {
+            field: amounts[kind]
+            for kind, field in AMOUNT_FIELDS.items()
+            if kind in amounts
+        }
+        if vals:
+            receipt.write(vals)
+        reconciled = 0
+        if payments:
+            reconciled = self._reconcile_payments(payments, residuals)
+        result = [
+            _("%(count)s entries read, %(reconciled)s lines reconciled")
+            % {"count": count, "reconciled": reconciled}
+        ]
+        if amounts.get("financed"):
+            result.append(_("Financed amount: %s") % amounts["financed"])
+        if unmatched:
+            result.append(
+                _("%(count)s unmatched references: %(refs)s")
+                % {
+                    "count": len(unmatched),
+                    "refs": ", ".join(unmatched[:MAX_UNMATCHED]),
+                }
+            )
+        self.write({"state": "done", "result": "\n".join(result)})
+        receipt.message_post(body="\n".join(result))
+        return {
+            "type": "ir.actions.act_window",
+            "res_model": self._name,
+            "res_id": self.id,
+            "view_mode": "form",
+            "target": "new",
+        }
+
+    def _prepare_payment_line_vals(self, line, amount, currency, company, date):
+        return {
+            "name": line.move_name,
+            "partner_id": line.partner_id.id,
+            "account_id": line.account_id.id,
+            "currency_id": currency.id,
+            "amount_currency": amount,
+            "balance": currency._convert(amount, company.currency_id, company, date),
+            # pairs the counterpart with the receipt line
+            "factor_origin_line_id": line.id,
+        }
+
+    def _reconcile_payments(self, payments, residuals):
+        """Book the payments collected by the factor against its current
+        account, in moves created in bulk, and reconcile them with the
+        receipt lines. Return the number of reconciled lines"""
+        receipt = self.receipt_id
+        journal = receipt.factor_journal_id
+        current_account = journal.factoring_current_account_id
+        if not current_account:
+            raise UserError(
+                _("Missing Current Account on journal %s") % journal.display_name
+            )
+        company = receipt.company_id
+        date = fields.Date.context_today(self)
+        aml_model = self.env["account.move.line"]
+        line_ids = list(payments)
+        move_vals = []
+        for batch_ids in split_every(MOVE_BATCH, line_ids):
+            line_vals = []
+            # currency: [amount, balance] of the current account
+            totals = defaultdict(lambda: [0.0, 0.0])
+            for line in aml_model.browse(batch_ids):
+                vals = self._prepare_payment_line_vals(
+                    line, -payments[line.id], line.currency_id, company, date
+                )
+                line_vals.append(vals)
+                totals[line.currency_id][0] -= vals["amount_currency"]
+                totals[line.currency_id][1] -= vals["balance"]
+            for currency, (amount, balance) in totals.items():
+                line_vals.append(
+                    {
+                        "name": _("Factor payments"),
+                        "account_id": current_account.id,
+                        "currency_id": currency.id,
+                        "amount_currency": amount,
+                        "balance": balance,
+                    }
+                )
+            move_vals.append(
+                {
+                    "move_type": "entry",
+                    "journal_id": journal.id,
+                    "date": date,
+                    "ref": _("Factor payments %s") % receipt.display_name,
+                    "line_ids": [Command.create(vals) for vals in line_vals],
+                }
+            )
+        moves = self.env["account.move"].create(move_vals)
+        moves.action_post()
+        counterparts = {
+            counterpart.factor_origin_line_id.id: counterpart
+            for counterpart in moves.line_ids
+            if counterpart.factor_origin_line_id
+        }
+        pairs = [(line, counterparts[line.id]) for line in aml_model.browse(line_ids)]
+        # fully paid lines are reconciled together by account, partner and
+        # currency: the pairing doesn't matter when every line is fully
+        # reconciled, mixed currencies would be matched in company currency
+        groups = defaultdict(lambda: aml_model)
+        partials = []
+        for line, counterpart in pairs:
+            if float_compare(
+                payments[line.id],
+                residuals[line.id],
+                precision_rounding=line.currency_id.rounding,
+            ):
+                partials.append(line | counterpart)
+            else:
+                key = (line.account_id, line.partner_id, line.currency_id)
+                groups[key] |= line | counterpart
+        for lines in list(groups.values()) + partials:
+            lines.reconcile()
+        return len(pairs)
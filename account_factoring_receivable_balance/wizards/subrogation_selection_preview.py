@@ -0,0 +1,41 @@
+# © 2024 David BEAL @ Akretion
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+from odoo import api, fields, models
+
+
+class SubrogationSelectionPreview(models.TransientModel):
+    _name = "subrogation.selection.preview"
+    _description = "Preview of the lines selected by a subrogation receipt"
+
+    receipt_id = fields.Many2one(
+        comodel_name="subrogation.receipt",
+        string="Subrogation Receipt",
+        required=True,
+        ondelete="cascade",
+    )
+    line_count = fields.Integer(readonly=True)
+    preview = fields.Html(readonly=True, sanitize=False)
+
+    @api.model
+    def default_get(self, fields_list):
+        "The preview is computed once, when the wizard is opened"
+        res = super().default_get(fields_list)
+        if res.get("receipt_id"):
+            res.update(
+                self._prepare_preview(
+                    self.env["subrogation.receipt"].browse(res["receipt_id"])
+                )
+            )
+        return res
+
+    @api.model
+    def _prepare_preview(self, receipt):
+        data = receipt._get_selection_preview()
+        return {
+            "line_count": data["count"],
+            "preview": self.env["ir.qweb"]._render(
+                "account_factoring_receivable_balance.subrogation_selection_preview",
+                {"data": data},
+            ),
+        }
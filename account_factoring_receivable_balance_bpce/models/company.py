@@ -6,7 +6,6 @@ import logging
 
 from odoo import Command, _, api, fields, models
 from odoo.exceptions import RedirectWarning, UserError
-from odoo.tests import Form
 
 logger = logging.getLogger(__name__)
 
@@ -54,23 +53,20 @@ class ResCompany(models.Model):
             company._configure_bpce_factoring(currency=currency.name)
         return company
 
-    def _prepare_data_for_factor(self, move_type="out_invoice"):
-        self.ensure_one()
-        move_form = Form(
-            self.env["account.move"]
-            .with_company(self.env.company)
-            .with_context(
-                default_move_type=move_type,
-                account_predictive_bills_disable_prediction=True,
-            )
-        )
-        move_form.invoice_date = fields.Date.from_string("2022-10-03")
-        move_form.date = move_form.invoice_date
-        move_form.partner_id = self.env.ref("base.res_partner_2")
+    def _get_factor_data_journal(self):
+        journal = super()._get_factor_data_journal()
+        if not journal and self.chart_template_id:
+            self._configure_bpce_factoring(currency=self.currency_id.name)
+            journal = super()._get_factor_data_journal()
+        return journal
 
-    def ui_populate_data_for_factor(self):
-        raise UserError(_("Not yet implemented"))
-        # self._prepare_data_for_factor()
+    def _prepare_factor_partner_vals(self, journal, index):
+        vals = super()._prepare_factor_partner_vals(journal, index)
+        if journal.factor_type == "bpce":
+            vals.update(
+                {"siret": f"{index:014d}", "bpce_factoring_balance": True}
+            )
+        return vals
 
     def ui_configure_bpce_factoring_balance(self):
         self.ensure_one()
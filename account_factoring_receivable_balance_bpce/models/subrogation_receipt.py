@@ -2,19 +2,95 @@
 # © 2022 Alexis DE LATTRE @ Akretion
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 
-import base64
 import re
+import tempfile
 
 from odoo import api, fields, models, tools
 from odoo.exceptions import UserError
 
+from odoo.addons.account_factoring_receivable_balance.tools import (
+    LayoutError,
+    RecordLayout,
+)
+from odoo.addons.account_factoring_receivable_balance.tools import LayoutField as F
+
 FORMAT_VERSION = "7.0"
 RETURN = "\r\n"
+BPCE_DATE = "%d%m%Y"
+
+HEADER = RecordLayout(
+    "BPCE 01",
+    [
+        F(None, 11, value="01000001138"),
+        F("code", 6, align="right", fill="0"),
+        F("devise", 3),
+        F("name", 25, align="right"),
+        F("statem_date", 8, ftype="date", date_format=BPCE_DATE),
+        F("date", 8, ftype="date", date_format=BPCE_DATE),
+        F("idfile", 3, align="right", fill="0"),
+        F(None, 3, value=FORMAT_VERSION),
+        F(None, 208),  # reserved
+    ],
+    width=275,
+)
+BODY = RecordLayout(
+    "BPCE 02",
+    [
+        F(None, 2, value="02"),
+        F("seq", 6, align="right", fill="0"),
+        F("siret", 14, fill="0"),
+        F("pname", 15),
+        F("ref_cli", 10),
+        F(None, 5),  # res1
+        F("activity", 1, offset=52),
+        F(None, 9),  # res2
+        F(None, 20),  # cmt
+        F("piece", 30),
+        F("piece_factor", 30),
+        F("type", 3),
+        F("paym", 3),
+        F("date", 8, ftype="date", date_format=BPCE_DATE),
+        F("date_due", 8, ftype="date", date_format=BPCE_DATE),
+        F("total", 13, align="right", fill="0", ftype="int"),
+        F("devise", 3, offset=177),
+        F(None, 2),  # res3
+        F(None, 1),  # eff_non_echu TODO
+        F(None, 7),  # eff_num TODO
+        F(None, 13, fill="0"),  # effet total TODO not implemented
+        F(None, 13, fill="0"),  # effet imputé TODO not implemented
+        F(None, 23),  # rib TODO
+        F(None, 8),  # date effet echeance TODO not implemented
+        F(None, 10),  # reférence tiré/le nom TODO not implemented
+        # 0: traite non accepté, 1: traite accepté, 2: BOR TODO not implemented
+        F(None, 1),  # eff_type
+        F(None, 17),  # res4
+    ],
+    width=275,
+)
+ENDER = RecordLayout(
+    "BPCE 09",
+    [
+        F(None, 2, value="09"),
+        F("seq", 6, align="right", fill="0"),
+        F(None, 3, value="138"),
+        F("code", 6, align="right", fill="0"),
+        F("name", 25, align="right"),
+        F("balance", 13, align="right", fill="0", ftype="int"),
+        F(None, 220),  # reserved
+    ],
+    width=275,
+)
 
 
 class SubrogationReceipt(models.Model):
     _inherit = "subrogation.receipt"
 
+    def _get_factor_file_hash_inputs(self):
+        res = super()._get_factor_file_hash_inputs()
+        if self.factor_type == "bpce":
+            res += [FORMAT_VERSION, self.company_id.bpce_factor_code]
+        return res
+
     def _prepare_factor_file_bpce(self):
         self.ensure_one()
         name = "BPCE_{}_{}_{}.txt".format(
@@ -26,7 +102,7 @@ class SubrogationReceipt(models.Model):
             "name": name,
             "res_id": self.id,
             "res_model": self._name,
-            "datas": self._prepare_factor_file_data_bpce(),
+            "stream": self._prepare_factor_file_data_bpce(),
         }
 
     def _prepare_factor_file_data_bpce(self):
@@ -40,36 +116,32 @@ class SubrogationReceipt(models.Model):
         if not self.statement_date:
             # pylint: disable=C8107
             raise UserError("Vous devez spécifier la date du dernier relevé")
-        body, max_row, balance = self._get_bpce_body()
-        header = self._get_bpce_header()
-        check_column_size(header)
-        ender = self._get_bpce_ender(max_row, balance)
-        check_column_size(ender)
-        raw_data = (f"{header}{RETURN}{body}{RETURN}{ender}{RETURN}").replace(
-            "False", "    "
-        )
-        data = clean_string(raw_data)
-        # check there is no regression in colmuns position
-        check_column_position(raw_data, self.factor_journal_id, False)
-        check_column_position(data, self.factor_journal_id)
         dev_mode = tools.config.options.get("dev_mode")
-        if dev_mode and dev_mode[0][-3:] == "pdb" or False:
-            # make debugging easier saving file on filesystem to check
-            debug(raw_data, "_raw")
-            debug(data)
-            # pylint: disable=C8107
-            raise UserError("See files /odoo/subrog*.txt")
-        total_in_erp = sum(self.line_ids.mapped("amount_currency"))
-        if round(balance, 2) != round(total_in_erp, 2):
-            # pylint: disable=C8107
-            raise UserError(
-                "Erreur dans le calul de la balance :"
-                f"\n - erp : {total_in_erp}\n - fichier : {balance}"
-            )
-        self.write({"balance": balance})
-        # non ascii chars are replaced
-        data = bytes(data, "ascii", "replace").replace(b"?", b" ")
-        return base64.b64encode(data)
+        debug_mode = dev_mode and dev_mode[0][-3:] == "pdb" or False
+        with BpceFileWriter(self.factor_journal_id, keep_raw=debug_mode) as writer:
+            writer.write(self._get_bpce_header())
+            with self._perf_phase("confirm", "bpce_body") as stat:
+                for row, amount in self._get_bpce_body():
+                    writer.write(row, amount=amount)
+                stat["rows"] = writer.body_count
+            balance = writer.balance
+            writer.write(self._get_bpce_ender(writer.body_count, balance))
+            self._job_progress(rows_written=writer.row_count)
+            if debug_mode:
+                # make debugging easier saving file on filesystem to check
+                debug(writer.getvalue(raw=True), "_raw")
+                debug(writer.getvalue())
+                # pylint: disable=C8107
+                raise UserError("See files /odoo/subrog*.txt")
+            total_in_erp = self._get_lines_balance()
+            if round(balance, 2) != round(total_in_erp, 2):
+                # pylint: disable=C8107
+                raise UserError(
+                    "Erreur dans le calul de la balance :"
+                    f"\n - erp : {total_in_erp}\n - fichier : {balance}"
+                )
+            self.write({"balance": balance})
+            return writer.detach()
 
     def _get_partner_field(self):
         res = super()._get_partner_field()
@@ -87,118 +159,145 @@ class SubrogationReceipt(models.Model):
 
     def _get_bpce_header(self):
         self = self.sudo()
-        info = {
-            "code": pad(self.company_id.bpce_factor_code, 6, 0),
-            "devise": self.factor_journal_id.currency_id.name,
-            "name": pad(self.company_id.partner_id.name, 25),
-            "statem_date": bpce_date(self.statement_date),
-            "date": bpce_date(self.date),
-            "idfile": pad(self.id, 3, 0),
-            "reserved": pad(" ", 208),
-            "format": FORMAT_VERSION,
-        }
-        string = "01000001138{code}{devise}{name}{statem_date}{date}"
-        string += "{idfile}{format}{reserved}"
-        return string.format(**info)
+        return encode_row(
+            HEADER,
+            (
+                self.company_id.bpce_factor_code,
+                self.factor_journal_id.currency_id.name,
+                self.company_id.partner_id.name,
+                self.statement_date,
+                self.date,
+                self.id,
+            ),
+        )
 
     def _get_bpce_ender(self, max_row, balance):
         self = self.sudo()
-        info = {
-            "seq": pad(max_row + 2, 6, 0),
-            "code": pad(self.company_id.bpce_factor_code, 6, 0),
-            "name": pad(self.company_id.partner_id.name[:25], 25),
-            "balance": pad(round(balance * 100), 13, 0),
-            "reserved": pad(" ", 220),
-        }
-        return "09{seq}138{code}{name}{balance}{reserved}".format(**info)
+        return encode_row(
+            ENDER,
+            (
+                max_row + 2,
+                self.company_id.bpce_factor_code,
+                self.company_id.partner_id.name[:25],
+                round(balance * 100),
+            ),
+        )
+
+    def _get_bpce_line_chunks(self):
+        """Yield the data of the body rows as lists of tuples, read by chunks:
+        (line id, move id, move name, move type, journal type, invoice date,
+        date, due date, amount total, currency, partner id, siret,
+        partner name, partner ref, partner country)
+        """
+        return self._iter_chunks(
+            """
+            SELECT aml.id, am.id, am.name, am.move_type, aj.type,
+                am.invoice_date, am.date, am.invoice_date_due,
+                am.amount_total_in_currency_signed, cur.name,
+                cp.id, cp.siret, cp.name, cp.ref, cp.country_id
+            FROM account_move_line aml
+            JOIN account_move am ON am.id = aml.move_id
+            JOIN account_journal aj ON aj.id = am.journal_id
+            JOIN res_currency cur ON cur.id = am.currency_id
+            LEFT JOIN res_partner p ON p.id = am.partner_id
+            LEFT JOIN res_partner cp ON cp.id = p.commercial_partner_id
+            WHERE aml.subrogation_id = %s
+            ORDER BY aml.date DESC, aml.move_name DESC, aml.id
+            """,
+            (self.id,),
+        )
+
+    def _get_bpce_od_types(self, move_ids):
+        """Debit or credit type of the general entries, in one query:
+        given by the first 411 line whose amount is the move total"""
+        group = self.env.ref("l10n_fr.1_pcg_411", raise_if_not_found=False)
+        if not move_ids or not group:
+            return {}
+        self.env.cr.execute(
+            """
+            SELECT DISTINCT ON (aml.move_id) aml.move_id,
+                CASE WHEN aml.debit = am.amount_total THEN 'D' ELSE 'C' END
+            FROM account_move_line aml
+            JOIN account_move am ON am.id = aml.move_id
+            JOIN account_account acc ON acc.id = aml.account_id
+            WHERE aml.move_id = ANY(%s)
+                AND acc.group_id = %s
+                AND GREATEST(aml.debit, aml.credit) = am.amount_total
+            ORDER BY aml.move_id, aml.id
+            """,
+            (list(move_ids), group.id),
+        )
+        return dict(self.env.cr.fetchall())
 
     def _get_bpce_body(self):
+        "Yield the body rows with their amount"
         self = self.sudo()
         sequence = 1
-        rows = []
-        balance = 0
-        for line in self.line_ids:
-            move = line.move_id
-            partner = line.move_id.partner_id.commercial_partner_id
-            if not partner:
-                raise UserError(f"Pas de partenaire sur la pièce {line.move_id}")
-            sequence += 1
-            name = pad(move.name, 30, position="left")
-            p_type = get_type_piece(move)
-            total = move.amount_total_in_currency_signed
-            info = {
-                "seq": pad(sequence, 6, 0),
-                "siret": pad(" ", 14)
-                if not partner.siret
-                else pad(partner.siret, 14, 0, position="left"),
-                "pname": pad(partner.name[:15], 15, position="left"),
-                "ref_cli": pad(partner.ref, 10, position="left"),
-                "res1": pad(" ", 5),
-                "activity": "D"
-                if partner.country_id == self.env.ref("base.fr")
-                else "E",
-                "res2": pad(" ", 9),
-                "cmt": pad(" ", 20),
-                "piece": name,
-                "piece_factor": get_piece_factor(name, p_type),
-                "type": p_type,
-                "paym": "VIR"
-                if p_type == "FAC"
-                else "   ",  # TODO only VIR is implemented
-                "date": bpce_date(move.invoice_date if p_type == "FAC" else move.date),
-                "date_due": bpce_date(move.invoice_date_due) or pad(" ", 8),
-                "total": pad(round(abs(total) * 100), 13, 0),
-                "devise": move.currency_id.name,
-                "res3": "  ",
-                "eff_non_echu": " ",  # TODO
-                "eff_num": pad(" ", 7),  # TODO
-                "eff_total": pad("", 13, 0),  # effet total TODO not implemented
-                "eff_imputed": pad("", 13, 0),  # effet imputé TODO not implemented
-                "rib": pad(" ", 23),  # TODO
-                "eff_echeance": pad(" ", 8),  # date effet echeance TODO not implemented
-                "eff_pull": pad(" ", 10),  # reférence tiré/le nom TODO not implemented
-                # 0: traite non accepté, 1: traite accepté, 2: BOR TODO not implemented
-                "eff_type": " ",
-                "res4": pad(" ", 17),
-            }
-            balance += total
-            fstring = "02{seq}{siret}{pname}{ref_cli}{res1}{activity}{res2}{cmt}"
-            fstring += "{piece}{piece_factor}{type}{paym}{date}{date_due}"
-            fstring += "{total}{devise}{res3}{eff_non_echu}{eff_num}{eff_total}"
-            fstring += "{eff_imputed}{rib}{eff_echeance}{eff_pull}{eff_type}{res4}"
-            string = fstring.format(**info)
-            check_column_size(string, fstring, info)
-            rows.append(string)
-        return (RETURN.join(rows), len(rows), balance)
-
-
-def get_piece_factor(name, p_type):
-    if not p_type:
-        return "{}{}".format(name[:15], pad(" ", 15))
-    return name[:30]
-
-
-def get_type_piece(move):
-    journal_type = move.journal_id.type
+        france_id = self.env.ref("base.fr").id
+        for line_data in self._get_bpce_line_chunks():
+            od_types = self._get_bpce_od_types(
+                {
+                    row[1]
+                    for row in line_data
+                    if row[3] == "entry" and row[4] == "general"
+                }
+            )
+            for (
+                __,
+                move_id,
+                move_name,
+                move_type,
+                journal_type,
+                invoice_date,
+                date,
+                date_due,
+                total,
+                currency,
+                partner_id,
+                siret,
+                partner_name,
+                partner_ref,
+                country_id,
+            ) in line_data:
+                if not partner_id:
+                    raise UserError(
+                        "Pas de partenaire sur la pièce "
+                        f"{self.env['account.move'].browse(move_id)}"
+                    )
+                sequence += 1
+                p_type = get_type_piece(
+                    move_type, journal_type, od_types.get(move_id), move_name
+                )
+                yield encode_row(
+                    BODY,
+                    (
+                        sequence,
+                        siret or " " * 14,
+                        partner_name[:15],
+                        partner_ref,
+                        "D" if country_id == france_id else "E",
+                        move_name,
+                        move_name,
+                        p_type,
+                        "VIR" if p_type == "FAC" else "",  # TODO only VIR implemented
+                        invoice_date if p_type == "FAC" else date,
+                        date_due,
+                        round(abs(total) * 100),
+                        currency,
+                    ),
+                ), total
+            # rows of the chunk are written once the next one is requested
+            self._job_progress(rows_written=sequence - 1)
+
+
+def get_type_piece(move_type, journal_type, od_type, move_name):
     p_type = False
-    move_type = move.move_type
     if move_type == "entry":
         if journal_type == "general":
             # TODO : improve
-            od_type = False
-            lines = move.line_ids.filtered(
-                lambda s: s.account_id.group_id == s.env.ref("l10n_fr.1_pcg_411")
-            )
-            for line in lines:
-                if max(line.debit, line.credit) == move.amount_total:
-                    if line.debit == move.amount_total:
-                        od_type = "D"
-                    else:
-                        od_type = "C"
-                    break
             if not od_type:
                 # pylint: disable=C8107
-                raise UserError(f"Impossible de déterminer le type de l'OD {move.name}")
+                raise UserError(f"Impossible de déterminer le type de l'OD {move_name}")
             p_type = f"OD{od_type}"
     elif move_type == "out_invoice":
         p_type = "FAC"
@@ -208,21 +307,57 @@ def get_type_piece(move):
     return p_type
 
 
-def bpce_date(date_field):
-    return date_field.strftime("%d%m%Y")
+class BpceFileWriter:
+    """Clean, check and encode the file row by row into a temporary file
 
+    Running totals of the body rows are kept for the ender row.
+    """
 
-def pad(string, pad, end=" ", position="right"):
-    "Complete string by leading `end` string from `position`"
-    if isinstance(end, int | float):
-        end = str(end)
-    if isinstance(string, int | float):
-        string = str(string)
-    if position == "right":
-        string = string.rjust(pad, end)
-    else:
-        string = string.ljust(pad, end)
-    return string
+    def __init__(self, factor_journal, keep_raw=False):
+        self.factor_journal = factor_journal
+        self.stream = tempfile.TemporaryFile()
+        self.raw_stream = keep_raw and tempfile.TemporaryFile() or None
+        self.row_count = 0
+        self.body_count = 0
+        self.balance = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        if self.stream:
+            self.stream.close()
+        if self.raw_stream:
+            self.raw_stream.close()
+
+    def write(self, row, amount=None):
+        "Write a row, rows with an amount belong to the body"
+        raw_row = row
+        row = clean_string(raw_row)
+        if amount is not None:
+            if not self.body_count:
+                # check there is no regression in colmuns position
+                check_column_position(raw_row, self.factor_journal, False)
+                check_column_position(row, self.factor_journal)
+            self.body_count += 1
+            self.balance += amount
+        # non ascii chars are replaced
+        self.stream.write(
+            bytes(f"{row}{RETURN}", "ascii", "replace").replace(b"?", b" ")
+        )
+        if self.raw_stream:
+            self.raw_stream.write(bytes(f"{raw_row}{RETURN}", "ascii", "replace"))
+        self.row_count += 1
+
+    def getvalue(self, raw=False):
+        stream = raw and self.raw_stream or self.stream
+        stream.seek(0)
+        return stream.read()
+
+    def detach(self):
+        "Give the file to the caller, which closes it"
+        stream, self.stream = self.stream, None
+        return stream
 
 
 def clean_string(string):
@@ -243,28 +378,22 @@ def debug(content, suffix=""):
         f.write(content)
 
 
-def check_column_size(string, fstring=None, info=None):
-    if len(string) != 275:
-        if fstring and info:
-            fstring = fstring.replace("{", "|{")
-            fstring = fstring.format(**info)
-            strings = fstring.split("|")
-            for mystr in strings:
-                strings[strings.index(mystr)] = f"{mystr}({len(mystr)})"
-            fstring = "|".join(strings)
-        else:
-            fstring = ""
+def encode_row(layout, values):
+    try:
+        return layout.encode(values)
+    except LayoutError as e:
         # pylint: disable=C8107
         raise UserError(
-            "La ligne suivante contient {} caractères au lieu de 275\n\n{}"
-            "\n\nDebugging string:\n{}s".format(len(string), string, fstring)
-        )
+            "La ligne suivante contient {} caractères au lieu de {}\n\n{}"
+            "\n\nDebugging string:\n{}".format(
+                len(e.row), layout.width, e.row, e.details
+            )
+        ) from None
 
 
-def check_column_position(content, factor_journal, final=True):
-    line2 = content.split(RETURN)[1]
-    # line2 = content.readline(2)
-    currency = line2[177:180]
+def check_column_position(row, factor_journal, final=True):
+    "Check the currency position in a body row"
+    currency = row[177:180]
     msg = "Problème de décalage colonne dans le fichier"
     if final:
         msg += " final"
@@ -1,12 +1,29 @@
 # © 2024 David BEAL @ Akretion
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 
-from odoo import api, exceptions, fields, models
+from fnmatch import fnmatch
+
+from odoo import api, exceptions, fields, models, tools
+from odoo.tools import frozendict
+
+# Settings expected in factor_data, by factor type.
+# Keys may be patterns, i.e. emetteur* for currency specific issuers.
+# Keys required_for_file may be empty until a file is generated
+FACTOR_SETTINGS_SCHEMA = {
+    "eurof": {
+        "client": {"required": True, "width": 5},
+        "emetteurD": {"required": True, "width": 5},
+        "emetteurE": {"required": True, "width": 5},
+        "emetteur*": {"width": 5},
+        # files are sent to this address
+        "mail_prod": {"required_for_file": True},
+    },
+}
 
 
 def ini_format_to_dict(multiline_text):
     vals = {}
-    for row in multiline_text.strip().split("\n"):
+    for row in (multiline_text or "").strip().split("\n"):
         if "=" in row and row[0] != "#":
             key, val = row.split("=")
             if "#" in val:
@@ -15,6 +32,10 @@ def ini_format_to_dict(multiline_text):
     return vals
 
 
+class FactorSettings(frozendict):
+    """Parsed and validated settings of a factor journal"""
+
+
 class AccountJournal(models.Model):
     _inherit = "account.journal"
 
@@ -26,14 +47,70 @@ class AccountJournal(models.Model):
         default="\nkey1 = value1 \nkey2 = value2  # comment",
         help="A saisir dans ce champ des clés / valeurs séparées par des =",
     )
-    factor_settings = fields.Char(compute="_compute_factor_settings")
-
-    @api.depends("factor_data")
-    def _compute_factor_settings(self):
+    @api.constrains("factor_data", "factor_type")
+    def _check_factor_data(self):
         for rec in self:
-            try:
-                rec.factor_settings = ini_format_to_dict(rec.factor_data)
-            except Exception:
+            rec._get_factor_settings()
+
+    def _get_factor_settings_schema(self, factor_type):
+        return FACTOR_SETTINGS_SCHEMA.get(factor_type, {})
+
+    def _get_factor_settings(self, for_file=False):
+        """Return the FactorSettings of the journal, raise if they are invalid
+        or, with for_file, if a key required to send a file is empty"""
+        self.ensure_one()
+        settings, errors = self._parse_factor_settings(
+            self.factor_type, self.factor_data
+        )
+        if errors:
+            raise exceptions.ValidationError("\n".join(errors))
+        if for_file:
+            schema = self._get_factor_settings_schema(self.factor_type)
+            missing_keys = [
+                key
+                for key, spec in schema.items()
+                if spec.get("required_for_file") and not settings.get(key)
+            ]
+            if missing_keys:
                 raise exceptions.ValidationError(
-                    f"Le format des data\n{rec.factor_data}\nn'est pas conforme"
-                ) from None
+                    f"Le journal '{self.name}' doit comporter les clés suivantes "
+                    f"{missing_keys} pour l'envoi des fichiers"
+                )
+        return settings
+
+    @api.model
+    @tools.ormcache("factor_type", "factor_data")
+    def _parse_factor_settings(self, factor_type, factor_data):
+        """Parse and check factor_data against the schema of the factor type
+
+        The cache key is the text itself: a new version of factor_data
+        is parsed again. Return (settings, errors).
+        """
+        try:
+            values = ini_format_to_dict(factor_data)
+        except Exception:
+            return FactorSettings(), (
+                f"Le format des data\n{factor_data}\nn'est pas conforme",
+            )
+        schema = self._get_factor_settings_schema(factor_type)
+        missing_keys = [
+            key
+            for key, spec in schema.items()
+            if spec.get("required") and not values.get(key)
+        ]
+        errors = []
+        if missing_keys:
+            errors.append(
+                f"Le journal doit comporter les clés suivantes {missing_keys} "
+                "avec des valeurs correctes"
+            )
+        for key, value in values.items():
+            for pattern, spec in schema.items():
+                width = spec.get("width")
+                if width and value and fnmatch(key, pattern) and len(value) != width:
+                    errors.append(
+                        f"La valeur '{value}' de la clé '{key}' "
+                        f"doit comporter {width} caractères"
+                    )
+                    break
+        return FactorSettings(values), tuple(errors)
@@ -20,8 +20,15 @@ class AccountMoveLine(models.Model):
     _inherit = "account.move.line"
 
     def _eurof_fields_rpt(self):
-        partner = self.partner_id.commercial_partner_id
-        ref = partner._get_partner_eurof_mapping().get(partner, "")
+        move = self.move_id
+        ref = (
+            self.env["res.partner"]
+            .with_company(self.company_id.id)
+            ._get_eurof_partner_ref(
+                move.partner_shipping_id, self.partner_id.commercial_partner_id
+            )[1]
+            or ""
+        )
         return {
             "Client": f"{ref}, {self.partner_id.name}",
             "Date": self.date,
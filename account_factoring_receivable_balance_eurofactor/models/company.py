@@ -9,9 +9,8 @@ pour l'envoi des credits : facture et avoir
 
 import logging
 
-from odoo import _, fields, models
+from odoo import Command, _, models
 from odoo.exceptions import RedirectWarning, UserError
-from odoo.tests import Form
 
 logger = logging.getLogger(__name__)
 
@@ -22,23 +21,45 @@ FACTO_TYPE = "eurof"
 class ResCompany(models.Model):
     _inherit = "res.company"
 
-    def _prepare_data_for_factor(self, move_type="out_invoice"):
-        self.ensure_one()
-        move_form = Form(
-            self.env["account.move"]
-            .with_company(self.env.company)
-            .with_context(
-                default_move_type=move_type,
-                account_predictive_bills_disable_prediction=True,
+    def _get_factor_data_journal(self):
+        journal = super()._get_factor_data_journal()
+        if not journal and self.chart_template_id:
+            self._configure_eurof_factoring()
+            journal = super()._get_factor_data_journal()
+        return journal
+
+    def _prepare_factor_partner_vals(self, journal, index):
+        vals = super()._prepare_factor_partner_vals(journal, index)
+        if journal.factor_type == FACTO_TYPE:
+            vals["siret"] = f"{index:014d}"
+            vals["id_numbers"] = [
+                Command.create(
+                    {
+                        "category_id": self.env["res.partner"]._get_eurof_category_id(),
+                        "name": f"{index:07d}",
+                    }
+                )
+            ]
+        return vals
+
+    def _factor_data_with_entries(self, journal):
+        # only invoices and credit notes are sent to Eurofactor
+        if journal.factor_type == FACTO_TYPE:
+            return False
+        return super()._factor_data_with_entries(journal)
+
+    def _configure_factor_partners(self, journal, partners):
+        res = super()._configure_factor_partners(journal, partners)
+        if journal.factor_type == FACTO_TYPE:
+            factor_bank = self.env["res.partner.bank"].create(
+                {
+                    "acc_number": f"FR76EUROF{self.id:06d}{journal.id:06d}",
+                    "partner_id": self.partner_id.id,
+                    "company_id": self.id,
+                }
             )
-        )
-        move_form.invoice_date = fields.Date.from_string("2025-10-03")
-        move_form.date = move_form.invoice_date
-        move_form.partner_id = self.env.ref("base.res_partner_2")
-
-    def ui_populate_data_for_factor(self):
-        raise UserError(_("Not yet implemented"))
-        # self._prepare_data_for_factor()
+            partners.with_company(self.id).factor_bank_id = factor_bank
+        return res
 
     def ui_configure_eurof_factoring_balance(self):
         self.ensure_one()
@@ -156,7 +177,10 @@ class ResCompany(models.Model):
         return company
 
     def _populate_eurof_settings(self):
-        return "client = 45678\nemetteurD = 54321\nemetteurE = 12345\nmail_prod = \n"
+        return (
+            "client = 45678\nemetteurD = 54321\nemetteurE = 12345\n"
+            "mail_prod = factoring@example.com\n"
+        )
 
     def _get_factor_shortname(self):
         """Allow to customze account name
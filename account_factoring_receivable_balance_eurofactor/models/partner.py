@@ -1,7 +1,8 @@
 # © 2024 David BEAL @ Akretion
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 
-from odoo import fields, models
+from odoo import api, fields, models, tools
+from odoo.tools import frozendict
 
 MODULE = __name__[12 : __name__.index(".", 13)]
 
@@ -15,17 +16,51 @@ class ResPartner(models.Model):
         groups="account.group_account_manager",
     )
 
-    def _get_partner_eurof_mapping(self):
+    @api.model
+    @tools.ormcache()
+    def _get_eurof_category_id(self):
         rec_categ = self.env.ref(f"{MODULE}.eurofactor_id_category")
-        categ = self.env["res.partner.id_category"].search(
-            [("code", "=", rec_categ.code)]
+        return (
+            self.env["res.partner.id_category"]
+            .sudo()
+            .search([("code", "=", rec_categ.code)])
+            .id
+        )
+
+    @api.model
+    def _get_partner_eurof_mapping(self):
+        "Eurofactor identifiers by partner id"
+        category = self.env["res.partner.id_category"].sudo()
+        category = category.browse(self._get_eurof_category_id())
+        return self._get_eurof_mapping_cached(
+            self.env.company.id, category.id, category.factor_mapping_version
         )
-        return {
-            x.partner_id: x.name
-            for x in self.env["res.partner.id_number"].search(
-                [("category_id", "=", categ.id)]
+
+    @tools.ormcache("company_id", "category_id", "version")
+    def _get_eurof_mapping_cached(self, company_id, category_id, version):
+        """The version of the category changes when its identifiers
+        are modified: the cache doesn't need to be cleared"""
+        id_numbers = (
+            self.env["res.partner.id_number"]
+            .sudo()
+            .search(
+                [
+                    ("category_id", "=", category_id),
+                    ("partner_id.company_id", "in", [False, company_id]),
+                ]
             )
-        }
+        )
+        return frozendict({x.partner_id.id: x.name for x in id_numbers})
+
+    @api.model
+    def _get_eurof_partner_ref(self, *partners):
+        """Return the first partner with a Eurofactor identifier
+        and this identifier, i.e. the shipping then the commercial partner"""
+        mapping = self._get_partner_eurof_mapping()
+        for partner in partners:
+            if mapping.get(partner.id):
+                return partner, mapping[partner.id]
+        return self.browse(), False
 
     def _check_eurof_data(self):
         "Check data completude"
@@ -42,3 +77,67 @@ class ResPartner(models.Model):
                     "n'ont pas de compte bancaire d'identifiant d'affacturage."
                 )
             return message
+
+    def write(self, vals):
+        if "company_id" in vals:
+            self.sudo().id_numbers._bump_eurof_mapping_version()
+        return super().write(vals)
+
+    def unlink(self):
+        self.sudo().id_numbers._bump_eurof_mapping_version()
+        return super().unlink()
+
+
+class ResPartnerIdCategory(models.Model):
+    _inherit = "res.partner.id_category"
+
+    factor_mapping_version = fields.Integer(
+        readonly=True,
+        copy=False,
+        help="Changed when the identifiers of the category are modified",
+    )
+
+    def init(self):
+        # a version is never reused, even by a rolled back transaction
+        self.env.cr.execute(
+            "CREATE SEQUENCE IF NOT EXISTS res_partner_id_category_mapping_seq"
+        )
+
+
+class ResPartnerIdNumber(models.Model):
+    _inherit = "res.partner.id_number"
+
+    def _bump_eurof_mapping_version(self):
+        "Invalidate the cached Eurofactor identifiers"
+        categ_id = self.env["res.partner"]._get_eurof_category_id()
+        if categ_id in self.sudo().category_id.ids:
+            category = self.env["res.partner.id_category"].browse(categ_id)
+            category.flush_recordset(["factor_mapping_version"])
+            self.env.cr.execute(
+                """
+                UPDATE res_partner_id_category
+                SET factor_mapping_version = nextval(
+                    'res_partner_id_category_mapping_seq'
+                )
+                WHERE id = %s
+                """,
+                (categ_id,),
+            )
+            category.invalidate_recordset(["factor_mapping_version"])
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        records._bump_eurof_mapping_version()
+        return records
+
+    def write(self, vals):
+        # identifiers may leave or enter the category
+        self._bump_eurof_mapping_version()
+        res = super().write(vals)
+        self._bump_eurof_mapping_version()
+        return res
+
+    def unlink(self):
+        self._bump_eurof_mapping_version()
+        return super().unlink()
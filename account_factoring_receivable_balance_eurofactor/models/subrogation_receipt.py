@@ -1,24 +1,91 @@
 # © 2024 David BEAL @ Akretion
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 
-import base64
-import inspect
 import re
+import tempfile
 
 from odoo import fields, models
 from odoo.exceptions import ValidationError
-from odoo.tools.safe_eval import safe_eval
 
-from .account_journal import ini_format_to_dict
+from odoo.addons.account_factoring_receivable_balance.tools import (
+    LayoutError,
+    RecordLayout,
+    ValidationCollector,
+)
+from odoo.addons.account_factoring_receivable_balance.tools import LayoutField as F
 
 RETURN = "\r\n"
+# part of the factor file hash, bump it when the layout changes
+FORMAT_VERSION = "1"
+
+DETAIL = RecordLayout(
+    "Eurofactor",
+    [
+        F("emetteur", 5),
+        F("client", 5),
+        F("file_date", 8, ftype="date"),
+        F("activity", 1),
+        F("afc", 3),
+        F("p_type", 1),
+        F("devise", 3),
+        F("ref_cli", 7),
+        F("ref_int", 15),
+        F(None, 23),  # blanc1
+        F("ref_move", 14),
+        F("total", 15, align="right", fill="0", ftype="int"),
+        F("date", 8, ftype="date"),
+        F("date_due", 8, ftype="date"),
+        F("paym", 1),
+        F("sale", 10),
+        F(None, 25),  # ref_f : autre ref facture
+        F("ref_a", 14),  # ref facture de l'avoir
+        F(None, 51),  # blanc2
+        F(None, 3),  # blanc3
+    ],
+    width=240,
+    separator=";",
+    terminator=";",
+)
 
 
 class SubrogationReceipt(models.Model):
     _inherit = "subrogation.receipt"
 
-    def _factor_settings(self):
-        return safe_eval(self.factor_journal_id.factor_settings)
+    def _factor_settings(self, for_file=False):
+        return self.factor_journal_id._get_factor_settings(for_file=for_file)
+
+    def _get_factor_file_hash_inputs(self):
+        res = super()._get_factor_file_hash_inputs()
+        if self.factor_type == "eurof":
+            category = self.env["res.partner.id_category"].sudo()
+            category = category.browse(self.env["res.partner"]._get_eurof_category_id())
+            res += [
+                FORMAT_VERSION,
+                self.factor_journal_id.factor_data,
+                # identifiers and factor banks don't change the partners
+                category.factor_mapping_version,
+                self._get_eurof_factor_bank_digest(),
+            ]
+        return res
+
+    def _get_eurof_factor_bank_digest(self):
+        "Digest of the factor banks of the partners in the company"
+        self.env["ir.property"].flush_model()
+        self.env.cr.execute(
+            """
+            SELECT md5(string_agg(
+                COALESCE(res_id, '') || '=' || COALESCE(value_reference, ''),
+                ',' ORDER BY res_id, company_id
+            ))
+            FROM ir_property
+            WHERE fields_id = %s AND (company_id = %s OR company_id IS NULL)
+            """,
+            (
+                self.env["ir.model.fields"]._get_id("res.partner", "factor_bank_id"),
+                self.company_id.id,
+            ),
+        )
+        return self.env.cr.fetchone()[0]
 
     def _prepare_factor_file_eurof(self):
         "Called from generic module"
@@ -26,41 +93,34 @@ class SubrogationReceipt(models.Model):
         if not self.statement_date:
             # pylint: disable=C8107
             raise ValidationError("Vous devez spécifier la date du dernier relevé")
-        settings = self._factor_settings()
-        missing_keys = []
-        for key in ini_format_to_dict(
-            self.env["res.company"]._populate_eurof_settings()
-        ):
-            if not settings.get(key):
-                missing_keys.append(key)
-        if missing_keys:
-            raise ValidationError(
-                f"Le journal doit comporter les clés suivantes {missing_keys} "
-                "avec des valeurs correctes"
-            )
-        data = []
-        lines, max_row, balance = self._get_eurof_body(settings)
-        if not lines:
-            return []
-        file_date = self._sanitize_filepath(f"{fields.Date.today()}")
-        company_ = self._sanitize_filepath(self.company_id.name)
-        # On peut avoir 2 fichiers
-        my_lines = {"emetteurD": [], "emetteurE": []}
-        for emetteur in my_lines.keys():
-            for line in lines:
-                if settings[emetteur] in line:
-                    my_lines[emetteur].append(line)
-            file_data = bytes(RETURN.join(my_lines[emetteur]), "ascii", "replace")
-            name = f"FAA{settings[emetteur]}_{file_date}_{company_}_{self.id}.txt"
-            data.append(
-                {
-                    "name": name,
-                    "res_id": self.id,
-                    "res_model": self._name,
-                    "datas": base64.b64encode(file_data.replace(b"?", b" ")),
-                }
-            )
-        return data
+        settings = self._factor_settings(for_file=True)
+        with PartitionedWriter() as writer:
+            with self._perf_phase("confirm", "eurof_body") as stat:
+                stat["rows"] = self._get_eurof_body(settings, writer)
+            if not stat["rows"]:
+                return []
+            file_date = self._sanitize_filepath(f"{fields.Date.today()}")
+            company_ = self._sanitize_filepath(self.company_id.name)
+            # un fichier par émetteur
+            data = []
+            for emetteur in writer.keys():
+                name = f"FAA{settings[emetteur]}_{file_date}_{company_}_{self.id}.txt"
+                data.append(
+                    {
+                        "name": name,
+                        "res_id": self.id,
+                        "res_model": self._name,
+                        "stream": writer.detach(emetteur),
+                    }
+                )
+            return data
+
+    def _get_eurof_issuer(self, settings, activity, currency):
+        """Settings key of the issuer of a row: 'emetteurD' for the
+        domestic market, 'emetteurE' for export. A currency specific
+        issuer may be configured with a key like 'emetteurE_USD'"""
+        key = f"emetteur{activity}"
+        return f"{key}_{currency}" if settings.get(f"{key}_{currency}") else key
 
     def _sanitize_filepath(self, string):
         string = super()._sanitize_filepath(string)
@@ -68,95 +128,96 @@ class SubrogationReceipt(models.Model):
             string = string.replace("-", "_")
         return string
 
-    def _get_eurof_body(self, settings):
-        errors = []
-
-        def size(size, data, info=None):
-            field = False
-            if info and isinstance(info, models.Model):
-                if hasattr(info, data):
-                    field = data
-                    data = info[data]
-            res = check_size(data, size, info=info, field=field)
-            if res:
-                errors.append(res)
-            else:
-                return data
-
+    def _get_eurof_body(self, settings, writer):
+        """Write the rows in the partition of their issuer
+        Return the number of rows, False in case of errors"""
+        issues = ValidationCollector()
         self = self.sudo()
-        sequence = 1
-        rows = []
-        balance = 0
-        partner_mapping = self.env["res.partner"]._get_partner_eurof_mapping()
-        size(5, settings["client"], "client")
-        size(5, settings["emetteurD"], "emetteurD")
-        size(5, settings["emetteurE"], "emetteurE")
-        for line in self.line_ids:
+        res_partner = self.env["res.partner"].with_company(self.company_id.id)
+        file_date = fields.Date.today()
+        france = self.env.ref("base.fr")
+        checked_partners = set()
+        move_row = (False, False)
+        for line in self._iter_eurof_lines(
+            progress=lambda: self._job_progress(rows_written=writer.row_count)
+        ):
             move = line.move_id
-            partner = line.move_id.commercial_partner_id
-            partner_ident = False
-            if partner_mapping.get(move.partner_shipping_id):
-                partner_ident = move.partner_shipping_id
-            elif partner_mapping.get(move.commercial_partner_id):
-                partner_ident = move.commercial_partner_id
-            else:
-                errors.append(
-                    f"Il manque un identifiant eurofactor pour la pièce '{move.name}'"
+            partner = move.commercial_partner_id
+            if partner.id not in checked_partners:
+                checked_partners.add(partner.id)
+                res = partner._check_eurof_data()
+                if res:
+                    issues.add("partner_data", res, partner)
+            if move_row[0] == move.id:
+                # a move is validated and encoded once,
+                # its lines are consecutive
+                if move_row[1]:
+                    writer.write(*move_row[1])
+                continue
+            partner_ident, ref_cli = res_partner._get_eurof_partner_ref(
+                move.partner_shipping_id, move.commercial_partner_id
+            )
+            if not partner_ident:
+                issues.add(
+                    "missing_ident",
+                    f"Il manque un identifiant eurofactor pour la pièce '{move.name}'",
+                    move,
                 )
-            ref_cli = partner_mapping.get(partner_ident)
-            res = partner._check_eurof_data()
-            if res:
-                errors.append(res)
-            sequence += 1
+            ref_cli = ref_cli or ""
+            if not check_size(issues, ref_cli, 7, record=partner):
+                ref_cli = None
             p_type = get_type_piece(move)
             # le montant est mis en cts
             total = int(round(abs(move.amount_total_in_currency_signed) * 100))
             activity = "E"
-            if partner.country_id == self.env.ref("base.fr"):
+            if partner.country_id == france:
                 activity = "D"
-            info = {
-                "emetteur": settings["emetteurD"]
-                if activity == "D"
-                else settings["emetteurE"],
-                "client": settings["client"],
-                "file_date": eurof_date(fields.Date.today()),
-                "activity": activity,
-                "afc": "711" if activity == "D" else "999",
-                "p_type": p_type,
-                "devise": move.currency_id.name,
-                "ref_cli": size(7, ref_cli or "", partner),
-                "ref_int": pad(partner.ref, 15, position="left"),
-                "blanc1": pad(" ", 23),
-                "ref_move": pad(cut(move.name, 14), 14, position="left"),
-                "total": pad(total, 15, 0),
-                "date": eurof_date(move.invoice_date if p_type == "F" else move.date),
-                "date_due": eurof_date(move.invoice_date_due),
-                "paym": "A",  # pas de traite utilisé pour notre client
-                "sale": " " * 10
-                if p_type == "A"
-                else pad(cut(move.invoice_origin, 10), 10, position="left"),
-                "ref_f": pad(" ", 25),  # autre ref facture
-                "ref_a": pad(cut(move.invoice_origin, 14), 14, position="left")
-                if p_type == "A"
-                else " " * 14,  # ref facture de l'avoir
-                "blanc2": pad(" ", 51),  # ref facture de l'avoir
-                "blanc3": pad(" ", 3),  # ref facture de l'avoir
-            }
-            responses = check_required(info, line.name)
-            if responses:
-                errors.extend(responses)
-            infos = [val for k, val in info.items()]
-            if infos:
-                string = ";".join([x or "" for x in infos]) + ";"
-                rows.append(string)
-        for row in rows:
-            res = check_column_size(row)
-            if res:
-                errors.append(res)
-        if errors:
-            self.warn = "\n%s" % "\n".join(errors)
-            return False, False, False
-        return (rows, len(rows), balance)
+            issuer = self._get_eurof_issuer(settings, activity, move.currency_id.name)
+            values = (
+                settings[issuer],
+                settings["client"],
+                file_date,
+                activity,
+                "711" if activity == "D" else "999",
+                p_type,
+                move.currency_id.name,
+                ref_cli,
+                partner.ref,
+                cut(move.name, 14),
+                total,
+                move.invoice_date if p_type == "F" else move.date,
+                move.invoice_date_due,
+                "A",  # pas de traite utilisé pour notre client
+                "" if p_type == "A" else cut(move.invoice_origin, 10),
+                cut(move.invoice_origin, 14) if p_type == "A" else "",
+            )
+            check_required(issues, values, line.name, move)
+            try:
+                move_row = (move.id, (issuer, DETAIL.encode(values)))
+            except LayoutError as e:
+                move_row = (move.id, False)
+                issues.add("row_size", check_column_size(e.row), move)
+                continue
+            writer.write(*move_row[1])
+        if issues:
+            self.warn = "\n%s" % "\n".join(issues.messages())
+            return False
+        return writer.row_count
+
+    def _iter_eurof_lines(self, progress=None):
+        """Yield the lines of the receipt, browsed by chunks.
+        progress is called once the lines of a chunk are processed"""
+        for rows in self._iter_chunks(
+            """
+            SELECT id FROM account_move_line
+            WHERE subrogation_id = %s
+            ORDER BY date DESC, move_name DESC, move_id, id
+            """,
+            (self.id,),
+        ):
+            yield from self.env["account.move.line"].browse([row[0] for row in rows])
+            if progress:
+                progress()
 
     def _compute_instruction(self):
         """Display mail where send file"""
@@ -164,7 +225,10 @@ class SubrogationReceipt(models.Model):
         for rec in self:
             instruction = ""
             if rec.factor_type == "eurof":
-                settings = safe_eval(self.factor_journal_id.factor_settings)
+                journal = rec.factor_journal_id
+                settings, __ = journal._parse_factor_settings(
+                    journal.factor_type, journal.factor_data
+                )
                 mail_prod = settings.get("mail_prod")
                 if mail_prod:
                     instruction = (
@@ -179,31 +243,74 @@ class SubrogationReceipt(models.Model):
             rec.instruction = rec.instruction or instruction
         return res
 
-    def _amount_eurof_rpt(self, france=True):
-        lines = self._eurof_lines_rpt(france)
-        return sum(lines.mapped("debit")) - sum(lines.mapped("credit"))
-
-    def _eurof_lines_rpt(self, france=True):
-        if france:
-            return self.line_ids.filtered(
-                lambda s: s.move_id.partner_shipping_id.country_id
-                == s.env.ref("base.fr")
-            )
+    def _get_eurof_report_data(self):
+        """Data of the report built in a single pass on the lines:
+        domestic and export sections with their total and rows"""
+        self.ensure_one()
+        settings = self._factor_settings()
+        france = self.env.ref("base.fr")
+        sections = {
+            "D": {
+                "title": "Marché domestique",
+                "emetteur": settings.get("emetteurD"),
+                "total": 0,
+                "rows": [],
+            },
+            "E": {
+                "title": "Marché export",
+                "emetteur": settings.get("emetteurE"),
+                "total": 0,
+                "rows": [],
+            },
+        }
+        labels = []
+        for line in self.line_ids:
+            if line.move_id.partner_shipping_id.country_id == france:
+                section = sections["D"]
+            else:
+                section = sections["E"]
+            fields_rpt = line._eurof_fields_rpt()
+            labels = labels or list(fields_rpt)
+            section["rows"].append(list(fields_rpt.values()))
+            section["total"] += line.debit - line.credit
+        return {
+            "client": settings.get("client"),
+            "labels": labels,
+            "sections": list(sections.values()),
+        }
+
+
+class PartitionedWriter:
+    """Write each row in the temporary file of its partition,
+    files are created as rows come"""
+
+    def __init__(self):
+        self.streams = {}
+        self.row_count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        for stream in self.streams.values():
+            stream.close()
+
+    def write(self, key, row):
+        stream = self.streams.get(key)
+        if stream is None:
+            stream = self.streams[key] = tempfile.TemporaryFile()
         else:
-            return self.line_ids.filtered(
-                lambda s: not s.move_id.partner_shipping_id.country_id
-                == s.env.ref("base.fr")
-            )
-
-    def _eurof_labels_rpt(self):
-        line = self.line_ids and self.line_ids[0]
-        return line._eurof_fields_rpt().keys()
+            stream.write(RETURN.encode())
+        # non ascii chars are replaced
+        stream.write(bytes(row, "ascii", "replace").replace(b"?", b" "))
+        self.row_count += 1
 
+    def keys(self):
+        return list(self.streams)
 
-def get_piece_factor(name, p_type):
-    if not p_type:
-        return "{}{}".format(name[:15], pad(" ", 15))
-    return name[:30]
+    def detach(self, key):
+        "Give the file of a partition to the caller, which closes it"
+        return self.streams.pop(key)
 
 
 def get_type_piece(move):
@@ -218,20 +325,6 @@ def get_type_piece(move):
     return p_type
 
 
-def pad(string, pad, end=" ", position="right"):
-    "Complete string by leading `end` string from `position`"
-    check_string(string)
-    if isinstance(end, int | float):
-        end = str(end)
-    if isinstance(string, int | float):
-        string = str(string)
-    if position == "right":
-        string = string.rjust(pad, end)
-    else:
-        string = string.ljust(pad, end)
-    return string
-
-
 def cut(string, size):
     res = string
     if not string:
@@ -241,26 +334,30 @@ def cut(string, size):
     return res
 
 
-def check_size(string, size, info=None, field=None):
-    res = check_string(string, info=info, field=field)
-    if res:
-        return res
-    if len(string) != size:
-        inspect_string = inspect_code(inspect.stack()[2], string, info)
-        return f"{inspect_string}\n\tLa taille de '{string}' devrait etre de {size}\n"
-    return False
-
-
-def check_string(string, info=None, field=None):
+def check_size(issues, string, size, record=None, field=None):
+    "Return True if `string` is a string of `size` chars"
     if not isinstance(string, str):
-        return (
-            f"{inspect_code(inspect.stack()[3], string, info, field)}\n\t"
-            "La chaine fournie est vide.\n"
+        issues.add(
+            "empty",
+            f"{record_label(record, field)}\n\tLa chaine fournie est vide.\n",
+            record,
+            field,
         )
-    return False
+        return False
+    if len(string) != size:
+        issues.add(
+            "size",
+            f"{record_label(record, field)}\n\t"
+            f"La taille de '{string}' devrait etre de {size}\n",
+            record,
+            field,
+        )
+        return False
+    return True
 
 
-def check_required(infos, name):
+def check_required(issues, values, name, record=None):
+    infos = dict(zip(DETAIL.names, values, strict=True))
     required = [
         "emetteur",
         "client",
@@ -272,23 +369,26 @@ def check_required(infos, name):
         "total",
         "date_due",
     ]
-    messages = []
     for key in required:
         datum = infos[key]
-        if datum:
+        if isinstance(datum, str):
             datum = datum.replace(" ", "")
-        if not datum:
-            messages.append(f"La donnée '{key}' pour '{name}' est manquante.")
-    return messages
+        if datum is None or datum is False or datum == "":
+            issues.add(
+                "required",
+                f"La donnée '{key}' pour '{name}' est manquante.",
+                record,
+                key,
+            )
 
 
-def inspect_code(stack, string, info=None, field=None):
+def record_label(record=None, field=None):
+    "Describe the record (and field) an issue is about"
     data = ""
-    if info and isinstance(info, models.Model):
-        if info:
-            data += f" sur le {info._description} '{info.display_name}'"
-            if field:
-                data += f", Champ: '{info._fields[field].string}'"
+    if record:
+        data += f" sur le {record._description} '{record.display_name}'"
+        if field:
+            data += f", Champ: '{record._fields[field].string}'"
     return data
 
 
@@ -315,7 +415,3 @@ def check_column_size(string):
             f"\nLa ligne suivante contient {len(string)} caractères au lieu de 240\n"
             f"{string}"
         )
-
-
-def eurof_date(date_field):
-    return date_field.strftime("%Y%m%d")
@@ -0,0 +1 @@
+from . import subrogation_report
@@ -0,0 +1,26 @@
+# © 2024 David BEAL @ Akretion
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+from odoo import api, models
+
+
+class SubrogationReport(models.AbstractModel):
+    _name = "report.account_factoring_receivable_balance_eurofactor.subrogation_report"
+    _description = "Eurofactor Subrogation Receipt Report"
+
+    @api.model
+    def _get_report_values(self, docids, data=None):
+        docs = self.env["subrogation.receipt"].browse(docids)
+        reports = {}
+        for doc in docs:
+            with doc._perf_phase("report", "report_data") as stat:
+                reports[doc.id] = doc._get_eurof_report_data()
+                stat["rows"] = sum(
+                    len(section["rows"]) for section in reports[doc.id]["sections"]
+                )
+        return {
+            "doc_ids": docids,
+            "doc_model": "subrogation.receipt",
+            "docs": docs,
+            "reports": reports,
+        }
@@ -0,0 +1,5 @@
+from . import test_benchmark
+from . import test_validation
+from . import test_partner
+from . import test_settings
+from . import test_file
@@ -0,0 +1,28 @@
+# © 2024 David BEAL @ Akretion
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+from odoo import fields
+from odoo.tests import TransactionCase
+
+
+class EurofCommon(TransactionCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        company = cls.env["res.company"]._create_french_company("Eurofactor test")
+        cls.env = cls.env(
+            context=dict(cls.env.context, allowed_company_ids=company.ids)
+        )
+        cls.company = company.with_env(cls.env)
+        cls.journal = cls.company._get_factor_data_journal()
+        cls.partners, cls.moves = cls.company._prepare_data_for_factor(
+            cls.journal, partner_count=3, move_count=12
+        )
+
+    def create_receipt(self, **vals):
+        vals.setdefault("statement_date", fields.Date.today())
+        receipt = self.env["subrogation.receipt"].create(
+            dict(vals, factor_journal_id=self.journal.id)
+        )
+        receipt.action_compute_lines()
+        return receipt
@@ -0,0 +1,104 @@
+# © 2024 David BEAL @ Akretion
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+"""End to end benchmark, not run by default:
+
+    odoo -i account_factoring_receivable_balance_eurofactor --test-enable \
+        --test-tags factoring_benchmark
+
+FACTORING_BENCHMARK_SIZES environment variable gives the numbers of lines
+to benchmark, i.e. FACTORING_BENCHMARK_SIZES=1000,10000,100000
+"""
+
+import logging
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from odoo import fields
+from odoo.tests import TransactionCase, tagged
+
+_logger = logging.getLogger(__name__)
+
+REPORT = "account_factoring_receivable_balance_eurofactor.subrogation_report_meta"
+
+
+@tagged("-standard", "-at_install", "post_install", "factoring_benchmark")
+class TestFactoringBenchmark(TransactionCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.company = cls.env["res.company"]._create_french_company(
+            "Factoring benchmark"
+        )
+        cls.env = cls.env(
+            context=dict(cls.env.context, allowed_company_ids=[cls.company.id])
+        )
+        cls.company = cls.company.with_env(cls.env)
+        cls.journal = cls.company._get_factor_data_journal()
+        cls.sizes = [
+            int(size)
+            for size in os.environ.get("FACTORING_BENCHMARK_SIZES", "1000").split(",")
+        ]
+        cls.results = []
+
+    @contextmanager
+    def measure(self, size, phase):
+        "Record duration, queries and peak of python memory of a phase"
+        self.env.flush_all()
+        queries = self.env.cr.sql_log_count
+        tracemalloc.start()
+        start = time.perf_counter()
+        yield
+        self.env.flush_all()
+        duration = time.perf_counter() - start
+        __, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.results.append(
+            (size, phase, duration, self.env.cr.sql_log_count - queries, peak)
+        )
+
+    def log_results(self):
+        _logger.info("%8s %-10s %10s %8s %10s", "lines", "phase", "s", "queries", "KiB")
+        for size, phase, duration, queries, peak in self.results:
+            _logger.info(
+                "%8s %-10s %10.2f %8s %10d",
+                size,
+                phase,
+                duration,
+                queries,
+                peak // 1024,
+            )
+
+    def test_benchmark(self):
+        for size in self.sizes:
+            with self.measure(size, "data"):
+                self.company._prepare_data_for_factor(
+                    self.journal,
+                    partner_count=max(10, size // 100),
+                    move_count=size,
+                )
+            receipt = self.env["subrogation.receipt"].create(
+                {
+                    "factor_journal_id": self.journal.id,
+                    "statement_date": fields.Date.today(),
+                }
+            )
+            with self.measure(size, "selection"):
+                lines = receipt._get_factor_lines()
+            self.assertEqual(len(lines), size)
+            with self.measure(size, "compute"):
+                receipt.action_compute_lines()
+            self.assertEqual(len(receipt.line_ids), size)
+            with self.measure(size, "file"):
+                data = receipt._prepare_factor_file("eurof")
+            self.assertTrue(data, receipt.warn)
+            with self.measure(size, "report"):
+                # test mode renders html unless forced
+                self.env["ir.actions.report"].with_context(
+                    force_report_rendering=True
+                )._render_qweb_pdf(REPORT, receipt.ids)
+            # the next size has its own draft receipt
+            receipt.state = "confirmed"
+        self.log_results()
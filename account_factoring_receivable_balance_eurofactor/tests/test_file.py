@@ -0,0 +1,69 @@
+# © 2024 David BEAL @ Akretion
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+from unittest.mock import patch
+
+from odoo.tests import tagged
+
+from odoo.addons.account_factoring_receivable_balance.models import (
+    subrogation_receipt,
+)
+
+from .common import EurofCommon
+
+
+@tagged("post_install", "-at_install")
+class TestEurofFile(EurofCommon):
+    def get_files(self, receipt, chunk_size):
+        "Content of the factor files by name, rows read by chunks of chunk_size"
+        with patch.object(subrogation_receipt, "CHUNK_SIZE", chunk_size):
+            data = receipt._prepare_factor_file("eurof")
+        files = {}
+        for datum in data:
+            with datum["stream"] as stream:
+                stream.seek(0)
+                files[datum["name"]] = stream.read()
+        return files
+
+    def test_chunk_boundary(self):
+        "The files don't depend on the size of the chunks"
+        receipt = self.create_receipt()
+        row_count = len(receipt.line_ids)
+        self.assertGreater(row_count, 2)
+        expected = self.get_files(receipt, row_count * 10)
+        self.assertTrue(expected)
+        for chunk_size in (1, row_count // 2, row_count - 1, row_count):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(self.get_files(receipt, chunk_size), expected)
+
+    def test_confirm_twice(self):
+        "Files of unchanged inputs are reused by the next confirmation"
+        receipt = self.create_receipt()
+        receipt.action_confirm()
+        files = receipt._get_factor_files()
+        self.assertTrue(files)
+        self.assertTrue(all(files.mapped("raw")))
+        attachment_ids = self.env["ir.attachment"].search(
+            [("res_model", "=", receipt._name), ("res_id", "=", receipt.id)]
+        )
+        receipt.state = "draft"
+        receipt.action_confirm()
+        self.assertEqual(receipt.state, "confirmed")
+        self.assertEqual(receipt._get_factor_files(), files)
+        self.assertEqual(
+            self.env["ir.attachment"].search(
+                [("res_model", "=", receipt._name), ("res_id", "=", receipt.id)]
+            ),
+            attachment_ids,
+        )
+
+    def test_confirm_identifier_changed(self):
+        "Files are generated again when an identifier of a partner changes"
+        receipt = self.create_receipt()
+        receipt.action_confirm()
+        files = receipt._get_factor_files()
+        receipt.state = "draft"
+        self.partners[0].id_numbers.name = "9999999"
+        receipt.action_confirm()
+        self.assertFalse(files.exists())
+        self.assertTrue(receipt._get_factor_files())
@@ -0,0 +1,34 @@
+# © 2024 David BEAL @ Akretion
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+from odoo import Command
+from odoo.tests import tagged
+
+from .common import EurofCommon
+
+
+@tagged("post_install", "-at_install")
+class TestEurofMapping(EurofCommon):
+    def mapping(self):
+        return self.env["res.partner"]._get_partner_eurof_mapping()
+
+    def test_mapping(self):
+        "The cached identifiers follow the changes of identifiers and partners"
+        category_id = self.env["res.partner"]._get_eurof_category_id()
+        partner = self.env["res.partner"].create(
+            {
+                "name": "Eurofactor mapping",
+                "id_numbers": [
+                    Command.create({"category_id": category_id, "name": "1234567"})
+                ],
+            }
+        )
+        self.assertEqual(self.mapping()[partner.id], "1234567")
+        partner.id_numbers.name = "7654321"
+        self.assertEqual(self.mapping()[partner.id], "7654321")
+        partner.company_id = self.env["res.company"].create({"name": "Other"})
+        self.assertNotIn(partner.id, self.mapping())
+        partner.company_id = False
+        self.assertIn(partner.id, self.mapping())
+        partner.id_numbers.unlink()
+        self.assertNotIn(partner.id, self.mapping())
@@ -0,0 +1,39 @@
+# © 2024 David BEAL @ Akretion
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+from odoo.exceptions import ValidationError
+from odoo.tests import tagged
+
+from .common import EurofCommon
+
+SETTINGS = "client = 45678\nemetteurD = 54321\nemetteurE = 12345\n"
+
+
+@tagged("post_install", "-at_install")
+class TestEurofSettings(EurofCommon):
+    def test_settings(self):
+        self.journal.factor_data = (
+            SETTINGS + "emetteurE_USD = 67890  # dollars\n# comment = 1\n"
+        )
+        settings = self.journal._get_factor_settings()
+        self.assertEqual(settings["emetteurE_USD"], "67890")
+        self.assertEqual(settings["client"], "45678")
+        self.assertNotIn("# comment", settings)
+
+    def test_missing_key(self):
+        with self.assertRaisesRegex(ValidationError, "emetteurE"):
+            self.journal.factor_data = "client = 45678\nemetteurD = 54321\n"
+
+    def test_wrong_width(self):
+        with self.assertRaisesRegex(ValidationError, "doit comporter 5 caractères"):
+            self.journal.factor_data = SETTINGS + "emetteurE_USD = 123\n"
+
+    def test_wrong_format(self):
+        with self.assertRaisesRegex(ValidationError, "n'est pas conforme"):
+            self.journal.factor_data = SETTINGS + "mail_prod = a = b\n"
+
+    def test_mail_prod_required_for_file(self):
+        self.journal.factor_data = SETTINGS + "mail_prod = \n"
+        receipt = self.create_receipt()
+        with self.assertRaisesRegex(ValidationError, "mail_prod"):
+            receipt._prepare_factor_file("eurof")
@@ -0,0 +1,37 @@
+# © 2024 David BEAL @ Akretion
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+from odoo.tests import tagged
+
+from .common import EurofCommon
+
+
+@tagged("post_install", "-at_install")
+class TestEurofValidation(EurofCommon):
+    def test_valid_data(self):
+        receipt = self.create_receipt()
+        self.assertTrue(receipt._prepare_factor_file("eurof"))
+        self.assertFalse(receipt.warn)
+
+    def test_missing_bank(self):
+        "An issue of a partner is reported once for all its moves"
+        partner = self.partners[0]
+        partner.factor_bank_id = False
+        receipt = self.create_receipt()
+        self.assertFalse(receipt._prepare_factor_file("eurof"))
+        self.assertEqual(receipt.warn.count("n'ont pas de compte bancaire"), 1)
+        self.assertIn(partner.display_name, receipt.warn)
+
+    def test_missing_identifier(self):
+        partner = self.partners[0]
+        partner.id_numbers.unlink()
+        receipt = self.create_receipt()
+        self.assertFalse(receipt._prepare_factor_file("eurof"))
+        moves = receipt.line_ids.move_id.filtered(
+            lambda s: s.commercial_partner_id == partner
+        )
+        self.assertTrue(moves)
+        for move in moves:
+            message = f"identifiant eurofactor pour la pièce '{move.name}'"
+            self.assertEqual(receipt.warn.count(message), 1)
+        self.assertNotIn("n'ont pas de compte bancaire", receipt.warn)
@@ -0,0 +1 @@
+from . import subrogation_return_import
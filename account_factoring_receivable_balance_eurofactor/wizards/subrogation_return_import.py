@@ -0,0 +1,14 @@
+# © 2024 David BEAL @ Akretion
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+from odoo import models
+
+
+class SubrogationReturnImport(models.TransientModel):
+    _inherit = "subrogation.return.import"
+
+    def _get_return_ref(self, move_name):
+        # pieces are sent with the last 14 chars of their name
+        if self.receipt_id.factor_type == "eurof":
+            return (move_name or "")[-14:]
+        return super()._get_return_ref(move_name)